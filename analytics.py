@@ -0,0 +1,205 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from charts import minmax_downsample, MAX_LINE_POINTS
+from categorize import normalize_descriptions
+
+# Trailing windows, in days, offered for rolling spend per category
+ROLLING_WINDOWS = [7, 30, 90]
+# Dates plotted per category on the rolling spend chart; longer ranges are sampled evenly
+MAX_ROLLING_POINTS = 500
+# Merchants listed in the top merchants table
+TOP_MERCHANTS = 10
+
+
+def _merchant_codes(values):
+    """Integer codes and labels of merchants, i.e. normalized descriptions."""
+    codes, uniques = pd.factorize(pd.Series(values, dtype='string[pyarrow]'), use_na_sentinel=True)
+    merchant_codes, labels = pd.factorize(np.append(normalize_descriptions(uniques).to_numpy(zero_copy_only=False), ''))
+    return merchant_codes[codes], np.asarray(labels, dtype=object)
+
+
+def _day_totals(day_codes, codes, weights, days, width):
+    """Per-day totals of weights for each of width codes, accumulated over days with a leading zero row."""
+    daily = np.bincount(day_codes * width + codes, weights=weights, minlength=days * width)
+    return np.vstack([np.zeros((1, width)), np.cumsum(daily.reshape(days, width), axis=0)])
+
+
+class Analytics:
+    """Time-window aggregates over one dataset version, computed once and sliced per date range.
+
+    Transactions are signed by crdr and summed per day: the closing balance, cumulative spend
+    and amounts per category and type, monthly totals and spend per merchant. No copy of the
+    transactions is kept, only the row order by date, so a date range is answered from the
+    daily aggregates without rescanning the dataset.
+    """
+
+    def __init__(self, df):
+        dates = pd.to_datetime(df['Date'], errors='coerce').to_numpy(dtype='datetime64[ns]')
+        order = np.argsort(dates, kind='stable')
+        self.order = order[~np.isnat(dates[order])]
+        days = dates[self.order].astype('datetime64[D]')
+        self.days = np.arange(days[0], days[-1] + 1) if len(days) else np.array([], dtype='datetime64[D]')
+        day_codes = (days - days[0]).astype(np.int64) if len(days) else np.array([], dtype=np.int64)
+        # Position in self.order of each day's first transaction, and of the end
+        self.day_offsets = np.searchsorted(day_codes, np.arange(len(self.days) + 1))
+        n_days = len(self.days)
+
+        amount = pd.to_numeric(df['Amount'], errors='coerce').fillna(0.0).to_numpy(dtype=float)[self.order]
+        crdr = df['crdr'].astype(object).to_numpy()[self.order]
+        credit, debit = crdr == 'Credit', crdr == 'Debit'
+        income = np.where(credit, amount, 0.0)
+        spend = np.where(debit, amount, 0.0)
+
+        # Closing balance per day rebuilt from signed amounts, anchored to the first balance the statement reports
+        statement = pd.to_numeric(df['Balance'], errors='coerce').to_numpy(dtype=float)[self.order]
+        known = np.flatnonzero(np.isfinite(statement))
+        opening = statement[known[0]] - np.cumsum(income - spend)[known[0]] if len(known) else 0.0
+        self.balance = opening + np.cumsum(np.bincount(day_codes, weights=income - spend, minlength=n_days))
+        self.statement_balance = np.full(n_days, np.nan)
+        last_known = known[np.append(day_codes[known][1:] != day_codes[known][:-1], True)] if len(known) else known
+        self.statement_balance[day_codes[last_known]] = statement[last_known]
+        # A day without transactions closes on the previous day's balance
+        quiet = np.diff(self.day_offsets) == 0
+        self.statement_balance[quiet] = pd.Series(self.statement_balance).ffill().to_numpy()[quiet]
+
+        # Spend and amounts per category and type, accumulated so any range or trailing window is one subtraction
+        category = pd.Series(df['Category'].astype(object).to_numpy()[self.order])
+        category_codes, categories = pd.factorize(category.where(category.notna(), 'Uncategorised'))
+        self.categories = [str(value) for value in categories]
+        width = max(len(self.categories), 1)
+        self.spend_cumsum = _day_totals(day_codes, category_codes, spend, n_days, width)
+        self.amount_cumsum = _day_totals(day_codes, category_codes, amount, n_days, width)
+        crdr_codes, self.crdr_labels = pd.factorize(pd.Series(crdr).where(credit | debit, 'Unknown'))
+        type_width = max(len(self.crdr_labels), 1)
+        self.crdr_count_cumsum = _day_totals(day_codes, crdr_codes, None, n_days, type_width)
+        self.crdr_amount_cumsum = _day_totals(day_codes, crdr_codes, amount, n_days, type_width)
+
+        # Calendar months with their changes on the previous month and the same month a year earlier
+        monthly = pd.DataFrame({'Income': income, 'Spend': spend, 'Net': income - spend}, index=pd.DatetimeIndex(dates[self.order]))
+        monthly = monthly.resample('MS').sum()
+        for col in ('Income', 'Spend', 'Net'):
+            monthly[f'{col} MoM'] = monthly[col].diff(1)
+            monthly[f'{col} YoY'] = monthly[col].diff(12)
+        self.monthly = monthly.rename_axis('Month').reset_index()
+
+        # Spend and debit count per day and merchant, ordered by day
+        merchant_codes, self.merchants = _merchant_codes(df['Description'].iloc[self.order])
+        spent = debit & (spend > 0)
+        keys, inverse = np.unique(day_codes[spent] * len(self.merchants) + merchant_codes[spent], return_inverse=True)
+        self.merchant_days = keys // len(self.merchants)
+        self.merchant_ids = keys % len(self.merchants)
+        self.merchant_spend = np.bincount(inverse, weights=spend[spent], minlength=len(keys))
+        self.merchant_count = np.bincount(inverse, minlength=len(keys))
+
+    def bounds(self):
+        """First and last transaction day, or (None, None) for an undated dataset."""
+        if not len(self.days):
+            return None, None
+        return pd.Timestamp(self.days[0]).date(), pd.Timestamp(self.days[-1]).date()
+
+    def _days(self, start=None, end=None):
+        """Indices into self.days of the first and last day of a range, inclusive; last < first when it is empty."""
+        if not len(self.days):
+            return 0, -1
+        first = 0 if start is None else max(int((np.datetime64(start, 'D') - self.days[0]).astype(int)), 0)
+        last = len(self.days) - 1 if end is None else min(int((np.datetime64(end, 'D') - self.days[0]).astype(int)), len(self.days) - 1)
+        return first, last
+
+    def rows(self, df, start=None, end=None):
+        """Transactions of df, the frame these analytics were built from, between two days in date order."""
+        first, last = self._days(start, end)
+        if last < first:
+            return df.iloc[:0]
+        return df.iloc[self.order[self.day_offsets[first]:self.day_offsets[last + 1]]]
+
+    def running_balance(self, start=None, end=None, max_points=MAX_LINE_POINTS):
+        """Reconstructed and reported closing balance per day, downsampled on the reconstruction."""
+        first, last = self._days(start, end)
+        keep = first + minmax_downsample(self.balance[first:last + 1], max_points) if last >= first else np.array([], dtype=int)
+        return pd.DataFrame({
+            'Date': self.days[keep].astype('datetime64[ns]'),
+            'Reconstructed': self.balance[keep],
+            'Statement': self.statement_balance[keep],
+        })
+
+    def rolling_spend(self, window, start=None, end=None, max_points=MAX_ROLLING_POINTS):
+        """Spend per category over the trailing window days, one row per plotted date and category.
+
+        Windows at the start of the range reach back into earlier transactions, as a trailing sum should.
+        """
+        first, last = self._days(start, end)
+        if last < first:
+            return pd.DataFrame({'Date': [], 'Category': [], 'Spend': []})
+        step = -(-(last - first + 1) // max_points)
+        positions = np.arange(last, first - 1, -step)[::-1]
+        totals = self.spend_cumsum[positions + 1] - self.spend_cumsum[np.maximum(positions + 1 - window, 0)]
+        return pd.DataFrame({
+            'Date': np.repeat(self.days[positions].astype('datetime64[ns]'), len(self.categories)),
+            'Category': np.tile(self.categories, len(positions)),
+            'Spend': totals[:, :len(self.categories)].ravel(),
+        })
+
+    def period_comparison(self, start=None, end=None):
+        """Monthly income, spend and net with month-over-month and year-over-year changes.
+
+        Months overlapping the range are listed with their full-month totals, and their
+        changes are measured against earlier months even when those are outside the range.
+        """
+        months = self.monthly['Month']
+        keep = np.ones(len(months), dtype=bool)
+        if start is not None:
+            keep &= (months >= pd.Timestamp(start).to_period('M').to_timestamp()).to_numpy()
+        if end is not None:
+            keep &= (months <= pd.Timestamp(end)).to_numpy()
+        return self.monthly[keep].reset_index(drop=True)
+
+    def top_merchants(self, start=None, end=None, n=TOP_MERCHANTS):
+        """Merchants with the highest spend in the range, by normalized description."""
+        first, last = self._days(start, end)
+        low, high = np.searchsorted(self.merchant_days, [first, last + 1])
+        ids = self.merchant_ids[low:high]
+        spend = np.bincount(ids, weights=self.merchant_spend[low:high], minlength=len(self.merchants))
+        count = np.bincount(ids, weights=self.merchant_count[low:high], minlength=len(self.merchants))
+        top = [code for code in np.argsort(-spend, kind='stable')[:n] if spend[code] > 0]
+        return pd.DataFrame({
+            'Merchant': [self.merchants[code] or '(no description)' for code in top],
+            'Spend': spend[top],
+            'Count': count[top].astype(int),
+        })
+
+    def _range_totals(self, cumsum, start, end):
+        first, last = self._days(start, end)
+        return cumsum[last + 1] - cumsum[first] if last >= first else np.zeros(cumsum.shape[1])
+
+    def category_totals(self, start=None, end=None):
+        """Total Amount per Category in the range, shaped like charts.category_totals."""
+        totals = pd.DataFrame({'Category': self.categories, 'Amount': self._range_totals(self.amount_cumsum, start, end)[:len(self.categories)]})
+        return totals.sort_values('Amount', ascending=False)
+
+    def crdr_totals(self, start=None, end=None):
+        """Transactions and amounts per type in the range, shaped like the 'crdr' rollup."""
+        labels = list(self.crdr_labels)
+        return pd.DataFrame({
+            'Type': labels,
+            'Count': self._range_totals(self.crdr_count_cumsum, start, end)[:len(labels)].astype(int),
+            'Amount': self._range_totals(self.crdr_amount_cumsum, start, end)[:len(labels)],
+        })
+
+
+_analytics = OrderedDict()
+_analytics_lock = threading.Lock()
+
+def get_analytics(key, df, max_cached=8):
+    """Analytics for a dataset version, built once and shared across reruns and date ranges; a key of None is never cached."""
+    if key is None:
+        return Analytics(df)
+    with _analytics_lock:
+        analytics = _analytics.get(key)
+        if analytics is None:
+            analytics = _analytics[key] = Analytics(df)
+            while len(_analytics) > max_cached:
+                _analytics.popitem(last=False)
+        _analytics.move_to_end(key)
+        return analytics
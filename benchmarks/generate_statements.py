@@ -0,0 +1,124 @@
+"""Synthetic bank statements for benchmarking the upload and chart pipeline.
+
+    python benchmarks/generate_statements.py --rows 100000 --format csv --layout plus_minus --out statement.csv
+"""
+import io
+import os
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+import openpyxl
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from categorize import DEFAULT_RULES
+
+# Column layouts of the generated statement and the upload mapping that parses each one
+LAYOUTS = {
+    'plus_minus': {
+        'columns': ['Txn Date', 'Narration', 'Amount', 'Balance'],
+        'mapping': {
+            'transaction_type': 'Plus/Minus',
+            'column_mapping': {'Date': 'Txn Date', 'Description': 'Narration', 'Amount': None, 'Category': None, 'crdr': None, 'Balance': 'Balance'},
+            'amount_column': 'Amount',
+        },
+    },
+    'debit_credit': {
+        'columns': ['Date', 'Description', 'Amount', 'Cr/Dr', 'Category', 'Balance'],
+        'mapping': {
+            'transaction_type': 'Debit/Credit',
+            'column_mapping': {'Date': 'Date', 'Description': 'Description', 'Amount': 'Amount', 'Category': 'Category', 'crdr': 'Cr/Dr', 'Balance': 'Balance'},
+        },
+    },
+    'split': {
+        'columns': ['Posting Date', 'Details', 'Withdrawals', 'Deposits', 'Balance'],
+        'mapping': {
+            'transaction_type': 'Separate Debit and Credit columns',
+            'column_mapping': {'Date': 'Posting Date', 'Description': 'Details', 'Amount': None, 'Category': None, 'crdr': None, 'Balance': 'Balance'},
+            'debit_column': 'Withdrawals',
+            'credit_column': 'Deposits',
+        },
+    },
+}
+# Excel sheets hold at most this many rows including the header
+XLSX_MAX_ROWS = 1048576
+# Categories whose transactions are money coming in
+INCOME_CATEGORIES = {'Income'}
+# Typical transaction size per category, used as the scale of a lognormal draw
+CATEGORY_SCALE = {'Income': 2500.0, 'Housing': 1200.0, 'Insurance': 80.0, 'Utilities': 60.0, 'Transfers': 200.0}
+
+
+def generate_statement(rows, seed=0, start='2015-01-01', opening_balance=5000.0, days=None):
+    """Date-ordered transactions with merchant-style descriptions, categories, signed amounts and a running balance."""
+    rng = np.random.default_rng(seed)
+    rules = DEFAULT_RULES
+    # Income is rarer per transaction but larger, which keeps the balance drifting rather than collapsing
+    weights = np.array([0.45 if rule['category'] in INCOME_CATEGORIES else 1.0 for rule in rules])
+    picks = rng.choice(len(rules), size=rows, p=weights / weights.sum())
+    keywords = np.array([rule['keyword'].upper() for rule in rules], dtype=object)[picks]
+    categories = np.array([rule['category'] for rule in rules], dtype=object)[picks]
+    references = rng.integers(1000, 999999, size=rows).astype(str)
+    locations = rng.choice(np.array(['LONDON', 'MUMBAI', 'NEW YORK', 'ONLINE', 'BERLIN', ''], dtype=object), size=rows)
+    descriptions = keywords + ' ' + locations + ' ' + references
+
+    scales = np.array([CATEGORY_SCALE.get(category, 25.0) for category in categories])
+    amounts = np.round(rng.lognormal(mean=0.0, sigma=0.8, size=rows) * scales, 2)
+    signs = np.where(np.isin(categories, list(INCOME_CATEGORIES)), 1.0, -1.0)
+    amounts = amounts * signs
+    balance = np.round(opening_balance + np.cumsum(amounts), 2)
+
+    # By default about twenty transactions a day, spread over at most thirty years
+    days = days or min(max(rows // 20, 30), 365 * 30)
+    dates = pd.Timestamp(start) + pd.to_timedelta(np.sort(rng.integers(0, days, size=rows)), unit='D')
+    return pd.DataFrame({
+        'Date': dates,
+        'Description': descriptions,
+        'Amount': amounts,
+        'Category': categories,
+        'Balance': balance,
+    })
+
+def to_layout(transactions, layout):
+    """Lay generated transactions out the way a bank export of the given layout would."""
+    dates = transactions['Date'].dt.strftime('%d/%m/%Y')
+    amounts = transactions['Amount']
+    if layout == 'plus_minus':
+        data = [dates, transactions['Description'], amounts, transactions['Balance']]
+    elif layout == 'debit_credit':
+        crdr = np.where(amounts >= 0, 'CR', 'DR')
+        data = [dates, transactions['Description'], amounts.abs(), crdr, transactions['Category'], transactions['Balance']]
+    elif layout == 'split':
+        data = [dates, transactions['Description'], (-amounts).where(amounts < 0), amounts.where(amounts >= 0), transactions['Balance']]
+    else:
+        raise ValueError(f"Unknown layout {layout!r}; expected one of {sorted(LAYOUTS)}")
+    return pd.DataFrame(dict(zip(LAYOUTS[layout]['columns'], data)))
+
+def statement_bytes(rows, file_format='csv', layout='plus_minus', seed=0):
+    """Encoded contents of a generated statement, as an uploaded file would deliver them."""
+    statement = to_layout(generate_statement(rows, seed), layout)
+    if file_format == 'csv':
+        return statement.to_csv(index=False).encode()
+    if file_format == 'xlsx':
+        if rows + 1 > XLSX_MAX_ROWS:
+            raise ValueError(f"An Excel sheet holds at most {XLSX_MAX_ROWS - 1} transactions; use csv for {rows} rows")
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet('Statement')
+        sheet.append(list(statement.columns))
+        for row in statement.astype(object).where(statement.notna(), None).itertuples(index=False):
+            sheet.append(list(row))
+        buffer = io.BytesIO()
+        workbook.save(buffer)
+        return buffer.getvalue()
+    raise ValueError(f"Unknown format {file_format!r}; expected 'csv' or 'xlsx'")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='plus_minus')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+    with open(args.out, 'wb') as f:
+        f.write(statement_bytes(args.rows, args.format, args.layout, args.seed))
@@ -0,0 +1,92 @@
+"""Check how long each page's top-level imports take on a cold interpreter against a budget.
+
+    python benchmarks/import_budget.py
+    python benchmarks/import_budget.py --update-budget
+
+Streamlit is imported first, as the server already has it loaded; the time reported is what the
+page's own imports add on top, i.e. the delay before a first load after a restart can render.
+Heavy modules a page must not import up front are listed per page and fail the check if loaded.
+"""
+import os
+import sys
+import ast
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'import_budget.json')
+PAGES = ['app.py', 'pages/1_Upload Data.py', 'pages/2_Charts.py', 'pages/3_login.py', 'pages/4_Admin.py']
+# Modules whose presence is reported for every page
+HEAVY_MODULES = ['pandas', 'numpy', 'pyarrow', 'plotly.express', 'openpyxl', 'pymongo']
+# Cold runs per page; the fastest is kept to smooth out disk and scheduler noise
+RUNS = 3
+# Headroom given to measured times when a new budget is written
+BUDGET_HEADROOM = 2.0
+
+MEASURE = """
+import sys, json, time
+import streamlit
+start = time.perf_counter()
+exec(compile(sys.argv[1], sys.argv[2], 'exec'), {'__name__': 'page_imports'})
+print(json.dumps({'seconds': time.perf_counter() - start, 'modules': [m for m in json.loads(sys.argv[3]) if m in sys.modules]}))
+"""
+
+
+def page_imports(path):
+    """Source of the import statements at the top level of a page script."""
+    with open(os.path.join(ROOT, path)) as f:
+        tree = ast.parse(f.read(), path)
+    return '\n'.join(ast.unparse(node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom)))
+
+def measure(path, runs=RUNS):
+    """Fastest cold import time of a page and the heavy modules its imports load."""
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', MEASURE, page_imports(path), path, json.dumps(HEAVY_MODULES)],
+            cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT), check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return min(results, key=lambda result: result['seconds'])
+
+def check(results, budget):
+    """Describe every page over its time budget or loading a module it should not."""
+    failures = []
+    for page, result in results.items():
+        limits = budget.get(page)
+        if limits is None:
+            continue
+        if result['seconds'] > limits['max_seconds']:
+            failures.append(f"{page}: imports took {result['seconds']:.3f}s, budget {limits['max_seconds']:.3f}s")
+        for module in set(result['modules']) & set(limits.get('forbidden', [])):
+            failures.append(f"{page}: imports {module} up front")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--budget', default=BUDGET_PATH)
+    parser.add_argument('--update-budget', action='store_true', help='set time budgets from this run, keeping forbidden modules')
+    args = parser.parse_args()
+
+    results = {page: measure(page) for page in PAGES}
+    for page, result in results.items():
+        print(f"{page:<26} {result['seconds']:>7.3f}s  {', '.join(result['modules']) or '-'}")
+
+    budget = {}
+    if os.path.exists(args.budget):
+        with open(args.budget) as f:
+            budget = json.load(f)
+    if args.update_budget:
+        for page, result in results.items():
+            budget.setdefault(page, {'forbidden': []})['max_seconds'] = round(max(result['seconds'] * BUDGET_HEADROOM, 0.05), 3)
+        with open(args.budget, 'w') as f:
+            json.dump(budget, f, indent=2, sort_keys=True)
+        print(f"Budget written to {args.budget}")
+        sys.exit(0)
+
+    failures = check(results, budget)
+    for failure in failures:
+        print(f"OVER BUDGET {failure}")
+    sys.exit(1 if failures else 0)
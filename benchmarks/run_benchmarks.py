@@ -0,0 +1,320 @@
+"""Time the upload-to-chart pipeline on generated statements and compare it with a stored baseline.
+
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --formats csv,xlsx
+    python benchmarks/run_benchmarks.py --sizes 1000,10000,100000 --formats csv,xlsx --update-baseline
+
+Every stage runs headlessly against mongomock and records its fastest wall time over REPEATS runs,
+peak RSS and the bytes it produces. Each statement size runs in its own process so earlier cases do not inflate its memory
+figures. Stage times are also stored relative to a fixed reference workload timed in the same
+process, and only those ratios are compared, so a baseline recorded on one machine holds on another.
+The run fails when a stage is slower, larger or heavier than the baseline allows.
+"""
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import threading
+import subprocess
+from contextlib import contextmanager
+
+os.environ.setdefault('FINCHART_DB_BACKEND', 'mongomock')
+# Session state and messages warn when used outside `streamlit run`
+os.environ.setdefault('STREAMLIT_LOGGER_LEVEL', 'error')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+import numpy as np
+import pandas as pd
+import streamlit as st
+import plotly.express as px
+from generate_statements import LAYOUTS, statement_bytes
+from custom_functions import save_session_state, retrieve_session_state
+from db import get_collection
+from ingest import parse_cache, parse_statement, read_sample
+from mapping import infer_mapping
+from categorize import apply_categories, clear_categorizers
+from dedup import FingerprintIndex
+from rollups import build_rollups
+from storage import store_file, load_rollups, to_frame
+from charts import balance_series, category_totals, amount_histogram, scatter_sample
+from analytics import Analytics, ROLLING_WINDOWS
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Allowed growth over the baseline before a stage counts as a regression
+TIME_TOLERANCE = 0.5
+RSS_TOLERANCE = 0.25
+BYTES_TOLERANCE = 0.1
+# Differences below these are noise regardless of the relative change; time is in reference workloads
+MIN_RELATIVE_TIME = 0.15
+MIN_RSS_MB = 20.0
+# Rows in the reference workload that stage times are measured against
+REFERENCE_ROWS = 200000
+# Runs of each stage and of the reference workload; the fastest one counts
+REPEATS = 5
+# How often peak RSS is sampled while a stage runs
+RSS_INTERVAL = 0.005
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        # Without /proc only the lifetime peak is available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@contextmanager
+def quiet_gc():
+    """Collect garbage up front and keep the collector off inside the block, as timeit does,
+    so a collection over objects left by earlier stages is not timed."""
+    gc.collect()
+    gc.disable()
+    try:
+        yield
+    finally:
+        gc.enable()
+
+def reference_seconds(rows=REFERENCE_ROWS, repeats=REPEATS):
+    """Fastest of several runs of a fixed workload like the pipeline's: string cleanup, factorizing, sorting and a groupby."""
+    rng = np.random.default_rng(0)
+    descriptions = pd.Series(rng.integers(0, rows // 10, size=rows)).map('POS {} STORE'.format)
+    amounts = pd.Series(rng.random(rows) * 1000)
+    best = None
+    for _ in range(repeats):
+        with quiet_gc():
+            start = time.perf_counter()
+            codes, _ = pd.factorize(descriptions.str.lower().str.replace(r'[^a-z ]+', ' ', regex=True))
+            amounts.groupby(codes).sum()
+            np.sort(amounts.to_numpy())
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+class RssSampler(threading.Thread):
+    """Background thread recording the highest RSS seen until stopped."""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_mb())
+        return self.peak
+
+
+def stage(results, name, run, prepare=None, repeats=REPEATS):
+    """Run a stage several times and record its fastest wall time, with the peak RSS and RSS growth of the first run.
+
+    prepare, when given, restores the stage's starting conditions outside the timing and returns the
+    arguments for run; run returns its output and the bytes it produced. The last output is returned.
+    """
+    record = {}
+    for attempt in range(repeats):
+        args = prepare() if prepare is not None else ()
+        sampler = RssSampler()
+        start_rss = sampler.peak
+        with quiet_gc():
+            sampler.start()
+            start = time.perf_counter()
+            try:
+                output, payload_bytes = run(*args)
+            finally:
+                seconds = time.perf_counter() - start
+                sampler.stop()
+        if attempt == 0:
+            record = {'payload_bytes': payload_bytes, 'peak_rss_mb': round(sampler.peak, 1), 'rss_growth_mb': round(sampler.peak - start_rss, 1), 'seconds': seconds}
+        record['seconds'] = min(record['seconds'], seconds)
+    record['seconds'] = round(record['seconds'], 4)
+    results[name] = record
+    return output
+
+def frame_bytes(frame):
+    return int(frame.memory_usage(deep=True).sum())
+
+
+def run_pipeline(rows, file_format, layout='plus_minus'):
+    """Run every pipeline stage on one generated statement and return the per-stage measurements."""
+    results = {}
+    content = statement_bytes(rows, file_format, layout)
+    options = dict({'amount_column': None, 'debit_column': None, 'credit_column': None}, **LAYOUTS[layout]['mapping'])
+
+    def cold_cache():
+        # Every run starts without cached samples and parses
+        parse_cache.clear()
+        return ()
+
+    def infer():
+        infer_mapping(read_sample(content, file_format))
+        return None, len(content)
+    stage(results, 'infer_mapping', infer, prepare=cold_cache)
+
+    def parse():
+        df = parse_statement(content, file_format, **options)
+        return df, frame_bytes(df)
+    df = stage(results, 'parse', parse, prepare=cold_cache)
+
+    def uncategorized():
+        # Categories are filled in place and remembered by the shared categorizer
+        clear_categorizers()
+        return (df.copy(),)
+
+    def categorize_dedup(parsed):
+        parsed = apply_categories(parsed)
+        parsed, _ = FingerprintIndex().add('benchmark', parsed)
+        return parsed, frame_bytes(parsed)
+    df = stage(results, 'categorize_dedup', categorize_dedup, prepare=uncategorized)
+
+    def rollups():
+        tables = build_rollups(df)
+        return tables, sum(frame_bytes(frame) for frame in tables.values())
+    tables = stage(results, 'rollups', rollups)
+
+    sessions = get_collection('benchmark.sessions')
+    chunks = get_collection('benchmark.chunks')
+    st.session_state.clear()
+    st.session_state.uploaded_files = {}
+    store_file('statement', processed=df, files=st.session_state.uploaded_files, rollups=tables)
+
+    def clear_collections():
+        # Saving again would find every chunk already uploaded
+        sessions.delete_many({})
+        chunks.delete_many({})
+        return ()
+
+    def save():
+        save_session_state('benchmark', sessions, chunks)
+        document = sessions.find_one({'username': 'benchmark'}, {'_id': 0})
+        return None, len(bson.encode(document)) + sum(doc['size'] for doc in chunks.find({}, {'size': 1}))
+    stage(results, 'save_session', save, prepare=clear_collections)
+
+    def logged_out():
+        st.session_state.clear()
+        return ()
+
+    def retrieve():
+        retrieve_session_state('benchmark', sessions, chunks)
+        restored = to_frame(st.session_state.uploaded_files['statement']['processed'])
+        return restored, frame_bytes(restored)
+    restored = stage(results, 'retrieve_session', retrieve, prepare=logged_out)
+
+    def restore_entry():
+        # Stored rollups are fetched on first use, which belongs to the charts stage
+        logged_out()
+        retrieve_session_state('benchmark', sessions, chunks)
+        return (st.session_state.uploaded_files['statement'],)
+
+    def charts(entry):
+        rollups = load_rollups(entry)
+        histogram = amount_histogram(restored)
+        figures = [
+            px.line(balance_series(rollups['daily']), x='Date', y='Balance'),
+            px.bar(category_totals(rollups['monthly_category']), x='Category', y='Amount', color='Category'),
+            px.pie(rollups['crdr'], names='Type', values='Count'),
+            px.scatter(scatter_sample(restored), x='Amount', y='Balance', color='Category', render_mode='webgl'),
+            px.bar(histogram, x='Amount', y='Count'),
+        ]
+        return None, sum(len(figure.to_json()) for figure in figures)
+    stage(results, 'charts', charts, prepare=restore_entry)
+
+    def analytics_outputs():
+        analytics = Analytics(restored)
+        first_day, last_day = analytics.bounds()
+        outputs = [analytics.running_balance(), analytics.period_comparison(), analytics.top_merchants(), analytics.category_totals(), analytics.crdr_totals()]
+        outputs += [analytics.rolling_spend(window) for window in ROLLING_WINDOWS]
+        # A narrower date range reuses the prepared arrays
+        middle = first_day + (last_day - first_day) / 2
+        outputs += [analytics.running_balance(middle, last_day), analytics.rolling_spend(ROLLING_WINDOWS[0], middle, last_day)]
+        return None, sum(frame_bytes(frame) for frame in outputs)
+    stage(results, 'analytics', analytics_outputs)
+    return results
+
+def run_case(rows, file_format, layout):
+    """Measure one statement size and format in a fresh interpreter."""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--case', f'{file_format}:{rows}', '--layout', layout],
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def compare(results, baseline, time_tolerance=TIME_TOLERANCE):
+    """Describe every stage that regressed against the baseline; times are compared as multiples of the reference workload."""
+    regressions = []
+    for case, stages in results.items():
+        for name, record in stages.items():
+            base = baseline.get(case, {}).get(name)
+            if base is None:
+                continue
+            relative, base_relative = record['relative_time'], base.get('relative_time')
+            if base_relative is not None and relative > base_relative * (1 + time_tolerance) and relative - base_relative > MIN_RELATIVE_TIME:
+                regressions.append(f"{case} {name}: {relative}x vs {base_relative}x the reference workload")
+            if record['peak_rss_mb'] > base['peak_rss_mb'] * (1 + RSS_TOLERANCE) and record['peak_rss_mb'] - base['peak_rss_mb'] > MIN_RSS_MB:
+                regressions.append(f"{case} {name}: peak RSS {record['peak_rss_mb']} MB vs {base['peak_rss_mb']} MB")
+            if record['payload_bytes'] > base['payload_bytes'] * (1 + BYTES_TOLERANCE):
+                regressions.append(f"{case} {name}: {record['payload_bytes']} bytes vs {base['payload_bytes']} bytes")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000', help='comma-separated row counts, up to 5000000')
+    parser.add_argument('--formats', default='csv,xlsx', help='comma-separated file formats')
+    parser.add_argument('--layout', choices=sorted(LAYOUTS), default='plus_minus')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--time-tolerance', type=float, default=TIME_TOLERANCE)
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        file_format, rows = args.case.split(':')
+        # First use of plotly, pyarrow and the regex caches is not part of any stage
+        run_pipeline(100, 'csv', args.layout)
+        # The reference is timed before and after the stages, so a slow spell on a shared machine shows in both
+        reference = reference_seconds()
+        results = run_pipeline(int(rows), file_format, args.layout)
+        reference = min(reference, reference_seconds())
+        for record in results.values():
+            record['relative_time'] = round(record['seconds'] / reference, 3)
+        print(json.dumps(results))
+        sys.exit(0)
+
+    results = {}
+    for file_format in args.formats.split(','):
+        for rows in [int(size) for size in args.sizes.split(',')]:
+            case = f'{file_format}-{args.layout}-{rows}'
+            results[case] = run_case(rows, file_format, args.layout)
+            for name, record in results[case].items():
+                print(f"{case:<28} {name:<18} {record['seconds']:>9.3f}s {record['relative_time']:>8.2f}x {record['peak_rss_mb']:>8.1f} MB peak {record['rss_growth_mb']:>+8.1f} MB {record['payload_bytes']:>12} B")
+
+    if args.update_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"Baseline written to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        sys.exit(0)
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.time_tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,171 @@
+import re
+import string
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# Keyword rules applied when a statement has no category of its own; user rules take precedence
+DEFAULT_RULES = [
+    {'keyword': 'salary', 'category': 'Income'},
+    {'keyword': 'payroll', 'category': 'Income'},
+    {'keyword': 'interest', 'category': 'Income'},
+    {'keyword': 'refund', 'category': 'Income'},
+    {'keyword': 'rent', 'category': 'Housing'},
+    {'keyword': 'mortgage', 'category': 'Housing'},
+    {'keyword': 'tesco', 'category': 'Groceries'},
+    {'keyword': 'sainsbury', 'category': 'Groceries'},
+    {'keyword': 'asda', 'category': 'Groceries'},
+    {'keyword': 'aldi', 'category': 'Groceries'},
+    {'keyword': 'lidl', 'category': 'Groceries'},
+    {'keyword': 'walmart', 'category': 'Groceries'},
+    {'keyword': 'kroger', 'category': 'Groceries'},
+    {'keyword': 'whole foods', 'category': 'Groceries'},
+    {'keyword': 'grocery', 'category': 'Groceries'},
+    {'keyword': 'supermarket', 'category': 'Groceries'},
+    {'keyword': 'uber eats', 'category': 'Dining'},
+    {'keyword': 'deliveroo', 'category': 'Dining'},
+    {'keyword': 'doordash', 'category': 'Dining'},
+    {'keyword': 'swiggy', 'category': 'Dining'},
+    {'keyword': 'zomato', 'category': 'Dining'},
+    {'keyword': 'mcdonald', 'category': 'Dining'},
+    {'keyword': 'starbucks', 'category': 'Dining'},
+    {'keyword': 'restaurant', 'category': 'Dining'},
+    {'keyword': 'cafe', 'category': 'Dining'},
+    {'keyword': 'uber', 'category': 'Transport'},
+    {'keyword': 'lyft', 'category': 'Transport'},
+    {'keyword': 'ola', 'category': 'Transport'},
+    {'keyword': 'tfl', 'category': 'Transport'},
+    {'keyword': 'railway', 'category': 'Transport'},
+    {'keyword': 'airline', 'category': 'Transport'},
+    {'keyword': 'shell', 'category': 'Transport'},
+    {'keyword': 'fuel', 'category': 'Transport'},
+    {'keyword': 'petrol', 'category': 'Transport'},
+    {'keyword': 'amazon', 'category': 'Shopping'},
+    {'keyword': 'ebay', 'category': 'Shopping'},
+    {'keyword': 'flipkart', 'category': 'Shopping'},
+    {'keyword': 'ikea', 'category': 'Shopping'},
+    {'keyword': 'netflix', 'category': 'Subscriptions'},
+    {'keyword': 'spotify', 'category': 'Subscriptions'},
+    {'keyword': 'apple com', 'category': 'Subscriptions'},
+    {'keyword': 'google', 'category': 'Subscriptions'},
+    {'keyword': 'electric', 'category': 'Utilities'},
+    {'keyword': 'water', 'category': 'Utilities'},
+    {'keyword': 'gas', 'category': 'Utilities'},
+    {'keyword': 'broadband', 'category': 'Utilities'},
+    {'keyword': 'vodafone', 'category': 'Utilities'},
+    {'keyword': 'insurance', 'category': 'Insurance'},
+    {'keyword': 'pharmacy', 'category': 'Health'},
+    {'keyword': 'boots', 'category': 'Health'},
+    {'keyword': 'hospital', 'category': 'Health'},
+    {'keyword': 'atm', 'category': 'Cash'},
+    {'keyword': 'cash withdrawal', 'category': 'Cash'},
+    {'keyword': 'transfer', 'category': 'Transfers'},
+    {'keyword': 'upi', 'category': 'Transfers'},
+    {'keyword': 'fee', 'category': 'Fees'},
+    {'keyword': 'charge', 'category': 'Fees'},
+]
+# Digits, punctuation and whitespace, which normalization removes from either end of a description
+TRIM_CHARACTERS = string.digits + string.punctuation + string.whitespace
+# Normalized descriptions each Categorizer remembers the category of; the least recently seen are forgotten first
+MAX_MEMOIZED = 100000
+
+
+def normalize_descriptions(values):
+    """Lower-case descriptions with digits and punctuation removed, so 'TESCO STORE 1234' and 'Tesco Store 98' match.
+
+    Returns an Arrow string array with '' for missing values. Runs in Arrow kernels, as reference
+    numbers make nearly every description distinct.
+    """
+    if not isinstance(values, (pa.Array, pa.ChunkedArray)):
+        values = pa.array(pd.Series(values, dtype='string[pyarrow]'))
+    # Trimming reference numbers off the ends first leaves few distinct texts for the regex to clean
+    text = pc.dictionary_encode(pc.utf8_trim(pc.utf8_lower(values), TRIM_CHARACTERS))
+    if isinstance(text, pa.ChunkedArray):
+        text = text.combine_chunks()
+    # Every run of characters other than letters, spaces included, becomes one space
+    cleaned = pc.utf8_trim_whitespace(pc.replace_substring_regex(text.dictionary, r'[^a-z]+', ' '))
+    return pc.fill_null(pc.take(cleaned, text.indices), '')
+
+
+class Categorizer:
+    """All keyword rules compiled into one alternation regex, with results memoized per normalized description."""
+
+    def __init__(self, rules, max_memoized=MAX_MEMOIZED):
+        self.rules = [rule for rule in rules if rule.get('keyword') and rule.get('category')]
+        self.categories = [rule['category'] for rule in self.rules]
+        words = [normalize_descriptions([rule['keyword']])[0].as_py() for rule in self.rules]
+        pattern = '|'.join(f"(?P<r{i}>\\b{re.escape(word)}\\b)" for i, word in enumerate(words) if word)
+        self._regex = re.compile(pattern) if pattern else None
+        self._memo = pa.table({'description': pa.array([], type=pa.large_string()), 'category': pa.array([], type=pa.string())})
+        self._max_memoized = max_memoized
+        self._lock = threading.Lock()
+
+    def _match(self, text):
+        match = self._regex.search(text) if self._regex is not None else None
+        return self.categories[int(match.lastgroup[1:])] if match else None
+
+    def _match_all(self, texts):
+        """Category for each normalized text in an Arrow array; an Arrow pass finds texts with any keyword,
+        so only those are searched in Python to tell which keyword matched first."""
+        categories = [None] * len(texts)
+        if self._regex is None:
+            return categories
+        for position in np.flatnonzero(pc.match_substring_regex(texts, self._regex.pattern).to_numpy(zero_copy_only=False)):
+            categories[position] = self._match(texts[position].as_py())
+        return categories
+
+    def categorize(self, descriptions):
+        """Category for every description; only descriptions not seen before are normalized and matched."""
+        codes, uniques = pd.factorize(pd.Series(descriptions, dtype='string[pyarrow]'), use_na_sentinel=True)
+        uniques = pa.array(uniques, type=pa.large_string())
+        labels = np.full(len(uniques) + 1, None, dtype=object)
+        with self._lock:
+            positions = pc.index_in(uniques, value_set=self._memo['description']).fill_null(-1).to_numpy()
+            seen = positions >= 0
+            labels[:-1][seen] = self._memo['category'].take(positions[seen]).to_numpy(zero_copy_only=False)
+            if not seen.all():
+                # Reference numbers make most descriptions unseen, but they share a few hundred merchants
+                normalized = pc.dictionary_encode(normalize_descriptions(uniques.filter(~seen)))
+                labels[:-1][~seen] = np.array(self._match_all(normalized.dictionary) + [None], dtype=object)[normalized.indices.to_numpy()]
+            # Descriptions just used move to the end, so the least recently used are dropped first
+            used = np.zeros(self._memo.num_rows, dtype=bool)
+            used[positions[seen]] = True
+            memo = pa.concat_tables([self._memo.filter(~used), pa.table({'description': uniques, 'category': pa.array(labels[:-1], type=pa.string())})])
+            self._memo = memo.slice(max(memo.num_rows - self._max_memoized, 0))
+        return pd.Series(labels[codes], index=getattr(descriptions, 'index', None), dtype=object)
+
+
+_categorizers = OrderedDict()
+_categorizers_lock = threading.Lock()
+
+def get_categorizer(user_rules=None, max_cached=32):
+    """Shared Categorizer for a user's rules followed by DEFAULT_RULES, so its memo survives reruns."""
+    rules = list(user_rules or []) + DEFAULT_RULES
+    key = tuple((rule.get('keyword'), rule.get('category')) for rule in rules)
+    with _categorizers_lock:
+        categorizer = _categorizers.get(key)
+        if categorizer is None:
+            categorizer = _categorizers[key] = Categorizer(rules)
+            while len(_categorizers) > max_cached:
+                _categorizers.popitem(last=False)
+        _categorizers.move_to_end(key)
+        return categorizer
+
+def clear_categorizers():
+    """Forget the shared categorizers and their memos."""
+    with _categorizers_lock:
+        _categorizers.clear()
+
+def apply_categories(df, user_rules=None):
+    """Fill missing Category values from the description rules."""
+    existing = df['Category']
+    missing = existing.isna() | (existing.astype('string').str.strip() == '').fillna(True)
+    if not missing.any():
+        return df
+    categories = get_categorizer(user_rules).categorize(df['Description'])
+    filled = existing.astype(object).where(~missing, categories)
+    df['Category'] = filled.astype('category') if isinstance(existing.dtype, pd.CategoricalDtype) else filled
+    return df
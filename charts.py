@@ -0,0 +1,121 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# Upper bounds on what each chart sends to the browser, independent of the number of transactions
+MAX_LINE_POINTS = 2000
+MAX_SCATTER_POINTS = 20000
+HISTOGRAM_BINS = 50
+
+
+def minmax_downsample(y, max_points=MAX_LINE_POINTS):
+    """Return indices keeping the min and max of an ordered series in each of max_points // 2 buckets."""
+    n = len(y)
+    if n <= max_points:
+        return np.arange(n)
+    buckets = max(max_points // 2, 1)
+    size = -(-n // buckets)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+    valid = ~np.all(np.isnan(padded), axis=1)
+    offsets = np.arange(buckets)[valid] * size
+    lows = offsets + np.nanargmin(padded[valid], axis=1)
+    highs = offsets + np.nanargmax(padded[valid], axis=1)
+    return np.unique(np.concatenate([lows, highs, [0, n - 1]]))
+
+def balance_series(df, max_points=MAX_LINE_POINTS):
+    """Date-sorted Balance series, downsampled so peaks and troughs survive; takes transactions or the daily rollup."""
+    series = pd.DataFrame({
+        'Date': pd.to_datetime(df['Date'], errors='coerce'),
+        'Balance': pd.to_numeric(df['Balance'], errors='coerce'),
+    }).dropna()
+    series = series.sort_values('Date', kind='stable').reset_index(drop=True)
+    keep = minmax_downsample(series['Balance'].to_numpy(dtype=float), max_points)
+    return series.iloc[keep]
+
+def category_totals(df):
+    """Total Amount per Category; takes transactions or the monthly category rollup."""
+    totals = pd.DataFrame({
+        'Category': df['Category'].astype(object).where(df['Category'].notna(), 'Uncategorised'),
+        'Amount': pd.to_numeric(df['Amount'], errors='coerce'),
+    })
+    return totals.groupby('Category', sort=False, as_index=False)['Amount'].sum().sort_values('Amount', ascending=False)
+
+def amount_histogram(df, bins=HISTOGRAM_BINS):
+    """Histogram of Amount computed in NumPy, one row per bin."""
+    amounts = pd.to_numeric(df['Amount'], errors='coerce').to_numpy(dtype=float)
+    amounts = amounts[np.isfinite(amounts)]
+    counts, edges = np.histogram(amounts, bins=bins) if len(amounts) else (np.array([], dtype=int), np.array([0.0]))
+    return pd.DataFrame({
+        'Amount': (edges[:-1] + edges[1:]) / 2,
+        'Count': counts,
+        'Width': np.diff(edges),
+    })
+
+def scatter_sample(df, max_points=MAX_SCATTER_POINTS, seed=0):
+    """Amount/Balance/Category rows for the scatter, sampled down to max_points."""
+    points = pd.DataFrame({
+        'Amount': pd.to_numeric(df['Amount'], errors='coerce'),
+        'Balance': pd.to_numeric(df['Balance'], errors='coerce'),
+        'Category': df['Category'],
+    })
+    if len(points) > max_points:
+        rows = np.sort(np.random.default_rng(seed).choice(len(points), max_points, replace=False))
+        points = points.iloc[rows]
+    return points
+
+
+class FigureCache:
+    """Process-wide LRU of serialized plotly figures keyed by dataset version, filter state and chart.
+
+    Figures are kept as the JSON-ready dicts plotly serializes, which rebuild into a figure far
+    faster than plotly express can regroup the data. Every chart caps its points, so entries
+    are bounded by count.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, key, payload):
+        with self._lock:
+            self._entries[key] = payload
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'hits': self.hits, 'misses': self.misses}
+
+
+figure_cache = FigureCache(int(os.environ.get('FINCHART_FIGURE_CACHE', 128)))
+
+def cached_figure(key, build):
+    """Serialized figure for key, calling build() for a plotly figure on a miss; a key of None is never cached."""
+    payload = figure_cache.get(key) if key is not None else None
+    if payload is None:
+        payload = build().to_plotly_json()
+        if key is not None:
+            figure_cache.put(key, payload)
+    return payload
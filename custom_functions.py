@@ -1,7 +1,16 @@
 import os
 import uuid
+import copy
+import queue
+import atexit
+import threading
+import time
+from datetime import datetime
 import streamlit as st
-import pandas as pd
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from db import get_collection
+from timing import span
 
 def navbar():
     """
@@ -24,14 +33,15 @@ def initialize_log():
         'session_id': str(uuid.uuid4()),
         'actions': [],
         'errors': [],
-        'date': pd.Timestamp.now()
+        'date': datetime.now()
     }
     st.session_state.log_id = None
+    st.session_state.log_sent = None
 
 def log_action(action, details=None):
     """Log an action in the session log."""
     log_entry = {
-        'timestamp': pd.Timestamp.now(),
+        'timestamp': datetime.now(),
         'action': action
     }
     if details:
@@ -41,26 +51,192 @@ def log_action(action, details=None):
 def log_error(error, details=None):
     """Log an error in the session log."""
     log_entry = {
-        'timestamp': pd.Timestamp.now(),
+        'timestamp': datetime.now(),
         'error': error
     }
     if details:
         log_entry['details'] = details
     st.session_state.log['errors'].append(log_entry)
 
+class LogSink:
+    """Queue session log deltas and write them to MongoDB in batches from a background thread."""
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval=2.0):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+        self.log_ids = {}
+        self.errors = {}
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, collection, session_id, update):
+        """Queue an update for a session log without waiting on the database."""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((collection, session_id, update))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def flush(self, timeout=10.0):
+        """Block until everything queued so far has been written, or has failed and is kept for a retry."""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        try:
+            self._queue.put((None, None, done), timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def stats(self):
+        """Counters for the admin page."""
+        with self._lock:
+            return {'queued': self._queue.qsize(), 'written': self.written, 'dropped': self.dropped, 'pending_errors': len(self.errors)}
+
+    def pop_error(self, session_id):
+        """Return and clear the last write error for a session, if any."""
+        with self._lock:
+            return self.errors.pop(session_id, None)
+
+    def pop_log_id(self, session_id):
+        """Return and forget the id of a session's log document once it has been created."""
+        with self._lock:
+            return self.log_ids.pop(session_id, None)
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="finchart-log-sink", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        # Items that failed to write stay at the front of the batch and are retried at the next flush interval
+        batch, retrying = [], False
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+            except queue.Empty:
+                item = None
+            waiter = None
+            if item is not None:
+                if item[0] is None:
+                    waiter = item[2]
+                else:
+                    batch.append(item)
+            if batch and (waiter is not None or (len(batch) >= self.batch_size and not retrying) or time.monotonic() >= deadline):
+                batch = self._write(batch)
+                retrying = bool(batch)
+                if len(batch) > self.max_queue:
+                    with self._lock:
+                        self.dropped += len(batch) - self.max_queue
+                    batch = batch[-self.max_queue:]
+            if waiter is not None:
+                waiter.set()
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+    def _write(self, batch):
+        """Merge queued deltas per session and send one bulk write per collection; returns the items not written."""
+        merged = {}
+        collections = {}
+        for collection, session_id, update in batch:
+            collections[collection.full_name] = collection
+            ops = merged.setdefault((collection.full_name, session_id), {})
+            for op, fields in update.items():
+                target = ops.setdefault(op, {})
+                for field, value in fields.items():
+                    if op == '$push':
+                        target.setdefault(field, {'$each': []})['$each'].extend(value)
+                    elif op == '$setOnInsert':
+                        target.setdefault(field, value)
+                    else:
+                        target[field] = value
+        failed = set()
+        for full_name, collection in collections.items():
+            keys = [key for key in merged if key[0] == full_name]
+            requests = [UpdateOne({'session_id': key[1]}, merged[key], upsert=True) for key in keys]
+            try:
+                upserted = collection.bulk_write(requests, ordered=False).upserted_ids.items()
+                errors = {}
+            except BulkWriteError as e:
+                # Unordered writes that did not fail went through and must not be sent twice
+                upserted = [(item['index'], item['_id']) for item in e.details.get('upserted', [])]
+                errors = {keys[item['index']]: e for item in e.details.get('writeErrors', [])}
+            except Exception as e:
+                upserted, errors = [], {key: e for key in keys}
+            with self._lock:
+                self.written += len(requests) - len(errors)
+                for index, upserted_id in upserted:
+                    self.log_ids[keys[index][1]] = upserted_id
+                for key, error in errors.items():
+                    self.errors[key[1]] = error
+            failed.update(errors)
+        return [item for item in batch if (item[0].full_name, item[1]) in failed]
+
+
+_log_sink = None
+_log_sink_lock = threading.Lock()
+
+def get_log_sink():
+    """Return the process-wide log sink, creating it on first use."""
+    global _log_sink
+    with _log_sink_lock:
+        if _log_sink is None:
+            _log_sink = LogSink()
+            atexit.register(_log_sink.flush)
+        return _log_sink
+
+@span('log.update')
 def update_log_in_db(log):
-    """Update the log entry in the database."""        
+    """Queue the part of the session log not yet sent to the database."""
     try:
-        result = log.update_one(
-            {'session_id': st.session_state.log['session_id']},
-            {'$set': st.session_state.log},
-            upsert=True
-        )
-        if st.session_state.log_id is None:
-            st.session_state.log_id = result.upserted_id
+        session_log = st.session_state.log
+        session_id = session_log['session_id']
+        sent = st.session_state.get('log_sent') or {'lists': {}, 'fields': {}}
+        update = {'$setOnInsert': {'date': session_log.get('date')}}
+        for key, value in session_log.items():
+            if key in ('session_id', 'date'):
+                continue
+            # The sink retries failed writes, so what is queued counts as sent
+            if isinstance(value, list):
+                start = sent['lists'].get(key, 0)
+                if len(value) > start:
+                    update.setdefault('$push', {})[key] = value[start:]
+                    sent['lists'][key] = len(value)
+            elif key not in sent['fields'] or sent['fields'][key] != value:
+                update.setdefault('$set', {})[key] = value
+                sent['fields'][key] = copy.deepcopy(value)
+        # Per-span totals replace the previous ones, a record per span as span names contain dots
+        spans = [
+            {'span': name, 'count': totals['count'], 'total_ms': round(totals['total_ms'], 2), 'max_ms': round(totals['max_ms'], 2)}
+            for name, totals in sorted(st.session_state.get('span_totals', {}).items())
+        ]
+        if spans and sent['fields'].get('span_totals') != spans:
+            update.setdefault('$set', {})['span_totals'] = spans
+            sent['fields']['span_totals'] = spans
+        st.session_state.log_sent = sent
+
+        sink = get_log_sink()
+        if len(update) > 1 or st.session_state.get('log_id') is None:
+            sink.submit(log, session_id, update)
+        if st.session_state.get('log_id') is None:
+            st.session_state.log_id = sink.pop_log_id(session_id)
+        error = sink.pop_error(session_id)
+        if error is not None:
+            st.error(f"Error updating log in database: {error}")
     except Exception as e:
         st.error(f"Error updating log in database: {e}")
 
+def flush_log():
+    """Write any queued log entries before the session goes away."""
+    get_log_sink().flush()
+
 def flex_buttons():
     st.markdown("""
             <style>
@@ -74,24 +250,48 @@ def flex_buttons():
             </style>
             """, unsafe_allow_html=True)
 
-def save_session_state(username,session_collection):
+# Session keys that are persisted through their own collections, or not at all, rather than in the session document;
+# parsed_df is a working copy of a file already stored in uploaded_files
+LOCAL_ONLY_KEYS = {'fingerprint_index', 'rerun_profiler', 'span_totals', 'processed_uploads', 'parsed_df'}
+
+@span('session.save')
+def save_session_state(username,session_collection,chunk_collection=None):
+    """Sync the session to the cloud, uploading only dataset chunks the server does not have."""
+    # pandas and pyarrow are only needed once a session is synced
+    from storage import encode_value
     try:
-        session_data = {key: value.to_dict('records') if isinstance(value, pd.DataFrame) else value for key, value in st.session_state.items()}
+        chunk_collection = chunk_collection if chunk_collection is not None else get_collection('finchart.chunks')
+        stats = {}
+        session_data = {key: encode_value(value, chunk_collection, stats) for key, value in st.session_state.items() if key not in LOCAL_ONLY_KEYS}
         session_collection.update_one(
             {"username": username},
             {"$set": {"session_state": session_data}},
             upsert=True
         )
-        st.success("Session state synced with cloud.")
+        st.success(f"Session state synced with cloud ({stats.get('uploaded', 0)} of {stats.get('chunks', 0)} data chunks uploaded).")
     except Exception as e:
         st.error(f"Error saving session state: {e}")
 
-def retrieve_session_state(username,session_collection):
+@span('session.retrieve')
+def retrieve_session_state(username,session_collection,chunk_collection=None):
+    """Restore the session from the cloud; stored datasets are fetched when first used."""
+    from storage import decode_value, to_table
     try:
+        chunk_collection = chunk_collection if chunk_collection is not None else get_collection('finchart.chunks')
         session_data = session_collection.find_one({"username": username})
         if session_data and "session_state" in session_data:
             for key, value in session_data["session_state"].items():
-                st.session_state[key] = pd.DataFrame(value) if isinstance(value, list) and all(isinstance(i, dict) for i in value) else value
+                # Frames are stored as dataset manifests, so lists such as category_rules stay lists;
+                # sessions saved before LOCAL_ONLY_KEYS existed may still hold those keys
+                if key not in LOCAL_ONLY_KEYS:
+                    st.session_state[key] = decode_value(value, chunk_collection)
+            # Older sessions stored files as lists of records, without a version to key shared caches on
+            for entry in st.session_state.get('uploaded_files', {}).values():
+                for kind in ('raw', 'processed'):
+                    if isinstance(entry.get(kind), list):
+                        entry[kind] = to_table(entry[kind])
+                if entry.get('processed') is not None and not entry.get('version'):
+                    entry['version'] = uuid.uuid4().hex
         st.toast("Session state retrieved from cloud.")
     except Exception as e:
         st.error(f"Error retrieving session state: {e}")
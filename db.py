@@ -0,0 +1,114 @@
+import os
+import threading
+import streamlit as st
+from pymongo import monitoring
+from pymongo.mongo_client import MongoClient
+from pymongo.server_api import ServerApi
+
+# Defaults for the shared connection pool, overridable through st.secrets or the environment
+DEFAULT_SETTINGS = {
+    'DB_MAX_POOL_SIZE': 50,
+    'DB_MIN_POOL_SIZE': 0,
+    'DB_MAX_IDLE_TIME_MS': 300000,
+    'DB_CONNECT_TIMEOUT_MS': 10000,
+    'DB_SERVER_SELECTION_TIMEOUT_MS': 10000,
+    'DB_SOCKET_TIMEOUT_MS': 20000,
+}
+
+_client = None
+_client_factory = None
+_client_lock = threading.Lock()
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Count connection pool events so the pool can be inspected at runtime."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {
+            'created': 0, 'closed': 0, 'checked_out': 0, 'checked_in': 0,
+            'checkout_failed': 0, 'pool_cleared': 0,
+        }
+
+    def _bump(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def pool_cleared(self, event): self._bump('pool_cleared')
+    def connection_created(self, event): self._bump('created')
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._bump('closed')
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): self._bump('checkout_failed')
+    def connection_checked_out(self, event): self._bump('checked_out')
+    def connection_checked_in(self, event): self._bump('checked_in')
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.counts)
+        stats['open'] = stats['created'] - stats['closed']
+        stats['in_use'] = stats['checked_out'] - stats['checked_in']
+        return stats
+
+
+pool_listener = PoolStats()
+
+
+def _setting(name):
+    """Read a pool setting from st.secrets, then the environment, then the defaults."""
+    try:
+        if name in st.secrets:
+            return int(st.secrets[name])
+    except Exception:
+        pass
+    return int(os.environ.get(name, DEFAULT_SETTINGS[name]))
+
+def _default_client():
+    DB_uri = (
+        f"mongodb+srv://{st.secrets['DB_USERNAME']}:{st.secrets['DB_PASSWORD']}"
+        f"@{st.secrets['DB_HOST']}/?retryWrites=true&w=majority&appName=Log"
+    )
+    return MongoClient(
+        DB_uri,
+        server_api=ServerApi('1'),
+        maxPoolSize=_setting('DB_MAX_POOL_SIZE'),
+        minPoolSize=_setting('DB_MIN_POOL_SIZE'),
+        maxIdleTimeMS=_setting('DB_MAX_IDLE_TIME_MS'),
+        connectTimeoutMS=_setting('DB_CONNECT_TIMEOUT_MS'),
+        serverSelectionTimeoutMS=_setting('DB_SERVER_SELECTION_TIMEOUT_MS'),
+        socketTimeoutMS=_setting('DB_SOCKET_TIMEOUT_MS'),
+        event_listeners=[pool_listener],
+    )
+
+def set_client_factory(factory):
+    """Replace how the shared client is built, e.g. with mongomock.MongoClient in tests."""
+    global _client, _client_factory
+    with _client_lock:
+        _client_factory = factory
+        _client = None
+
+def get_client():
+    """Return the single MongoClient shared by every session in this process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            factory = _client_factory
+            if factory is None and os.environ.get('FINCHART_DB_BACKEND') == 'mongomock':
+                import mongomock
+                factory = mongomock.MongoClient
+            _client = factory() if factory is not None else _default_client()
+        return _client
+
+def get_collection(name):
+    """Return a collection handle by its 'database.collection' name, e.g. 'finchart.users'."""
+    database, collection = name.split('.', 1)
+    return get_client()[database][collection]
+
+def pool_stats():
+    """Report the configured pool limits and the current connection counts."""
+    stats = pool_listener.snapshot()
+    stats.update({name.lower(): _setting(name) for name in DEFAULT_SETTINGS})
+    return stats
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+from bson.binary import Binary
+
+# Columns that identify a transaction across overlapping statements
+FINGERPRINT_COLUMNS = ['Date', 'Amount', 'Description', 'Balance']
+
+
+def fingerprint_rows(df):
+    """One uint64 hash per row over the normalized FINGERPRINT_COLUMNS."""
+    dates = df['Date'] if pd.api.types.is_datetime64_any_dtype(df['Date']) else df['Date'].astype('string').str.strip()
+    normalized = pd.DataFrame({
+        'Date': dates,
+        'Amount': pd.to_numeric(df['Amount'], errors='coerce').round(2),
+        'Description': df['Description'].astype('string').str.strip().str.lower().str.replace(r'\s+', ' ', regex=True),
+        'Balance': pd.to_numeric(df['Balance'], errors='coerce').round(2),
+    })
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy(dtype=np.uint64)
+
+
+class FingerprintIndex:
+    """Fingerprints of the rows kept so far, grouped by the content digest of the file they came from.
+
+    A set of every kept fingerprint is updated as files are added and removed, so checking a file
+    costs time in its own rows only. A row is kept only when no other file holds it, so files never
+    share a fingerprint and removing one file's fingerprints leaves the others in the set.
+    """
+
+    def __init__(self, sources=None):
+        self.sources = {}
+        self._seen = set()
+        for digest, fingerprints in (sources or {}).items():
+            self.sources[digest] = fingerprints
+            self._seen.update(fingerprints.tolist())
+
+    def __len__(self):
+        return sum(len(fps) for fps in self.sources.values())
+
+    def remove(self, digest):
+        """Forget the rows registered under digest."""
+        fingerprints = self.sources.pop(digest, None)
+        if fingerprints is not None:
+            self._seen.difference_update(fingerprints.tolist())
+
+    def add(self, digest, df):
+        """Drop rows already held by other files and register the remainder under digest.
+
+        Re-adding the same file replaces its own fingerprints, so reruns are idempotent.
+        Returns the kept rows and the number dropped.
+        """
+        fingerprints = fingerprint_rows(df)
+        self.remove(digest)
+        seen = self._seen
+        keep = np.fromiter((fp not in seen for fp in fingerprints.tolist()), dtype=bool, count=len(fingerprints))
+        self.sources[digest] = fingerprints[keep]
+        seen.update(self.sources[digest].tolist())
+        return df[keep].reset_index(drop=True), int((~keep).sum())
+
+
+def load_fingerprint_index(username, collection):
+    """Read a user's fingerprint index, one document per source file."""
+    sources = {}
+    for doc in collection.find({'username': username}):
+        sources[doc['digest']] = np.frombuffer(doc['fingerprints'], dtype=np.uint64)
+    return FingerprintIndex(sources)
+
+def save_fingerprint_index(username, index, collection, digests):
+    """Store the fingerprints of the given source files for a user."""
+    for digest in digests:
+        collection.replace_one(
+            {'username': username, 'digest': digest},
+            {'username': username, 'digest': digest, 'fingerprints': Binary(index.sources[digest].tobytes())},
+            upsert=True
+        )
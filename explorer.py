@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import streamlit as st
+
+# Rows sent to the browser per explorer page
+PAGE_SIZE = 100
+# Text columns with at most this many distinct values are filtered by equality instead of searched
+MAX_CATEGORIES = 50
+# Column searched by the text box when present; otherwise every text column is searched
+SEARCH_COLUMN = 'Description'
+
+
+def _is_range_column(values):
+    return pd.api.types.is_datetime64_any_dtype(values) or (
+        pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values)
+    )
+
+def _lower_text(values):
+    return pc.utf8_lower(pa.array(values.astype('string').fillna(''), type=pa.string()))
+
+
+class FrameIndex:
+    """Sorted and categorical indexes over a frame, so filters only touch matching rows.
+
+    Dates and numbers get a sort order for range filters, categories and short text columns
+    get integer codes for equality filters, and descriptions are lower-cased once for search.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self.sorted = {}
+        self.codes = {}
+        text = []
+        for col in df.columns:
+            values = df[col]
+            if _is_range_column(values):
+                array = values.to_numpy(dtype='datetime64[ns]') if pd.api.types.is_datetime64_any_dtype(values) else values.to_numpy(dtype=float, na_value=np.nan)
+                order = np.argsort(array, kind='stable')
+                self.sorted[col] = (order, array[order], array)
+            elif isinstance(values.dtype, pd.CategoricalDtype) or values.nunique() <= MAX_CATEGORIES:
+                codes, uniques = pd.factorize(values.astype(object))
+                self.codes[col] = (codes, [str(value) for value in uniques])
+            else:
+                text.append(col)
+        search = [SEARCH_COLUMN] if SEARCH_COLUMN in df.columns else text
+        if not search:
+            self.search = None
+        elif len(search) == 1:
+            self.search = _lower_text(df[search[0]])
+        else:
+            self.search = pc.binary_join_element_wise(*[_lower_text(df[col]) for col in search], '\n')
+
+    @property
+    def filterable(self):
+        return [col for col in self.df.columns if col in self.sorted or col in self.codes]
+
+    def bounds(self, col):
+        """Smallest and largest non-missing value of a range column."""
+        _, values, _ = self.sorted[col]
+        present = values[~pd.isna(values)]
+        return (present[0], present[-1]) if len(present) else (None, None)
+
+    def categories(self, col):
+        return self.codes[col][1]
+
+    def filter(self, ranges=None, equals=None, search=None):
+        """Row positions matching every filter, in original order.
+
+        The narrowest range filter selects the candidate rows from its sort order; the
+        remaining filters are checked against those candidates only.
+        """
+        checks = []
+        for col, (low, high) in (ranges or {}).items():
+            order, values, _ = self.sorted[col]
+            start, stop = np.searchsorted(values, low, 'left'), np.searchsorted(values, high, 'right')
+            checks.append((stop - start, col, order[start:stop]))
+        checks.sort(key=lambda check: check[0])
+        candidates = np.sort(checks[0][2]) if checks else np.arange(len(self.df))
+        for _, col, _ in checks[1:]:
+            low, high = ranges[col]
+            values = self.sorted[col][2][candidates]
+            candidates = candidates[(values >= low) & (values <= high)]
+        for col, wanted in (equals or {}).items():
+            if not wanted:
+                continue
+            codes, labels = self.codes[col]
+            wanted = set(wanted)
+            wanted_codes = [i for i, label in enumerate(labels) if label in wanted]
+            candidates = candidates[np.isin(codes[candidates], wanted_codes)]
+        if search and self.search is not None:
+            matches = pc.match_substring(self.search.take(pa.array(candidates)), search.lower())
+            candidates = candidates[matches.to_numpy(zero_copy_only=False)]
+        return candidates
+
+    def page(self, positions, page, page_size=PAGE_SIZE):
+        """Rows of one page of a filter result."""
+        return self.df.iloc[positions[page * page_size:(page + 1) * page_size]]
+
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def get_index(key, df, max_cached=8):
+    """FrameIndex for a dataset version, built once and shared across reruns; a key of None is never cached."""
+    if key is None:
+        return FrameIndex(df)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = FrameIndex(df)
+            while len(_indexes) > max_cached:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(key)
+        return index
+
+def render_explorer(df, index_key, widget_key):
+    """Filter widgets over an indexed frame, showing one page of matching rows at a time."""
+    index = get_index(index_key, df)
+    columns = st.multiselect('Filter on', index.filterable, key=f'{widget_key}_columns')
+    ranges, equals = {}, {}
+    for col in columns:
+        if col in index.codes:
+            equals[col] = st.multiselect(col, index.categories(col), key=f'{widget_key}_{col}')
+            continue
+        low, high = index.bounds(col)
+        if low is None:
+            continue
+        if np.issubdtype(np.asarray(low).dtype, np.datetime64):
+            chosen = st.date_input(col, (pd.Timestamp(low).date(), pd.Timestamp(high).date()), key=f'{widget_key}_{col}')
+            if len(chosen) == 2:
+                ranges[col] = (np.datetime64(chosen[0], 'ns'), np.datetime64(chosen[1], 'ns') + np.timedelta64(1, 'D') - np.timedelta64(1, 'ns'))
+        elif low < high:
+            ranges[col] = st.slider(col, float(low), float(high), (float(low), float(high)), key=f'{widget_key}_{col}')
+    search = st.text_input('Search', key=f'{widget_key}_search', placeholder='Case-insensitive text search')
+    positions = index.filter(ranges, equals, search)
+    pages = max(1, -(-len(positions) // PAGE_SIZE))
+    page = st.number_input(f'Page (of {pages})', min_value=1, max_value=pages, value=1, key=f'{widget_key}_page')
+    st.caption(f"{len(positions)} of {len(index.df)} rows match")
+    st.dataframe(index.page(positions, min(page, pages) - 1), use_container_width=True)
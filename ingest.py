@@ -0,0 +1,293 @@
+import io
+import re
+import csv
+import os
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from itertools import islice
+import pandas as pd
+from normalize import FIXED_COLUMNS, normalize_statement, coercion_entry
+from schema import apply_schema
+from timing import span
+
+
+class ParseCache:
+    """Process-wide LRU of parsed statements, bounded by the total size of the cached frames."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(deep=True).sum())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (df, size)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.nbytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self.nbytes, 'max_bytes': self.max_bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+parse_cache = ParseCache(int(os.environ.get('FINCHART_PARSE_CACHE_MB', 256)) * 1024 * 1024)
+
+# Rows read per chunk while streaming a statement, rows scanned when looking for the header,
+# and rows read to preview a statement and infer its column mapping
+CHUNK_ROWS = 50000
+HEADER_SCAN_ROWS = 20
+SAMPLE_ROWS = 200
+# Text cells that read as amounts ('-3.50', '(1,234.00)', '£12 CR') or dates ('01/01/2024', '1 Jan 2024', 'Jan 1, 2024')
+AMOUNT_PATTERN = re.compile(r'^[(+-]?\s*[^\w\s]{0,3}\s*[+-]?[\d.,]*\d\s*\)?\s*(?:cr|dr)?\.?$', re.IGNORECASE)
+DATE_PATTERNS = [
+    re.compile(r'^\d{1,4}[-/.]\d{1,2}[-/.]\d{1,4}\b'),
+    re.compile(r'^\d{1,2}[-/ ]?[a-z]{3,9}[-/ ,]*\d{2,4}\b', re.IGNORECASE),
+    re.compile(r'^[a-z]{3,9}\.? \d{1,2},? \d{4}\b', re.IGNORECASE),
+]
+
+
+def file_digest(content):
+    """Content hash identifying an uploaded file regardless of its name."""
+    return hashlib.sha256(content).hexdigest()
+
+def _cached(key, build):
+    """Return a private copy of the cached frame for key, building it on a miss."""
+    df = parse_cache.get(key)
+    if df is None:
+        df = build()
+        parse_cache.put(key, df)
+    return df.copy()
+
+def _is_value(cell):
+    """Whether a cell reads as data rather than a column name: a number or a date, typed or as text."""
+    if not isinstance(cell, str):
+        return True
+    text = cell.strip()
+    return bool(AMOUNT_PATTERN.match(text) or any(pattern.match(text) for pattern in DATE_PATTERNS))
+
+def detect_header_row(rows):
+    """Index of the row most likely to be the header.
+
+    Rows score one point per text cell and lose one per number or date, so a header with blank
+    cells still beats the data below it; the first row with the best score wins.
+    """
+    best, best_score = 0, 0
+    for i, row in enumerate(rows):
+        cells = [cell for cell in row if cell is not None and not (isinstance(cell, float) and pd.isna(cell)) and str(cell).strip() != '']
+        values = sum(_is_value(cell) for cell in cells)
+        score = len(cells) - 2 * values
+        if score > best_score:
+            best, best_score = i, score
+    return best
+
+def _header_names(row):
+    names, seen = [], {}
+    for i, cell in enumerate(row):
+        name = str(cell).strip() if cell is not None and str(cell).strip() else f"Unnamed: {i}"
+        if name in seen:
+            seen[name] += 1
+            name = f"{name}.{seen[name]}"
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+def excel_sheets(content):
+    """Names of the worksheets in an Excel file, read without loading any cells."""
+    # openpyxl is only loaded once an Excel file is uploaded
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def iter_excel_chunks(content, sheet=None, chunk_rows=CHUNK_ROWS, usecols=None):
+    """Stream an Excel sheet in read-only mode as DataFrames of at most chunk_rows rows."""
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet in workbook.sheetnames else workbook.worksheets[0]
+        worksheet.reset_dimensions()
+        rows = worksheet.iter_rows(values_only=True)
+        head = list(islice(rows, HEADER_SCAN_ROWS))
+        if not head:
+            return
+        header = detect_header_row(head)
+        columns = _header_names(head[header])
+        width = len(columns)
+        pending = [row[:width] for row in head[header + 1:]]
+        while True:
+            pending.extend(row[:width] for row in islice(rows, chunk_rows - len(pending)))
+            if not pending:
+                break
+            chunk = pd.DataFrame.from_records(pending, columns=columns).dropna(how='all')
+            if usecols is not None:
+                chunk = chunk[usecols]
+            if not chunk.empty:
+                yield chunk
+            if len(pending) < chunk_rows:
+                break
+            pending = []
+    finally:
+        workbook.close()
+
+def iter_csv_chunks(content, chunk_rows=CHUNK_ROWS, usecols=None):
+    """Read a CSV file in chunks of at most chunk_rows rows, skipping any preamble above the header."""
+    lines = io.TextIOWrapper(io.BytesIO(content), encoding='utf-8', errors='replace', newline='')
+    preview = [row for row in islice(csv.reader(lines), HEADER_SCAN_ROWS)]
+    header = detect_header_row(preview)
+    # Blank lines are kept so skiprows counts the same rows as the preview, then dropped like empty Excel rows
+    for chunk in pd.read_csv(io.BytesIO(content), skiprows=header, chunksize=chunk_rows, usecols=usecols, skip_blank_lines=False):
+        chunk = chunk.dropna(how='all')
+        if not chunk.empty:
+            yield chunk
+
+def iter_statement_chunks(content, file_type, sheet=None, chunk_rows=CHUNK_ROWS, usecols=None):
+    """Stream an uploaded statement chunk by chunk, whatever its format, optionally keeping only usecols."""
+    if file_type == 'csv':
+        return iter_csv_chunks(content, chunk_rows, usecols)
+    return iter_excel_chunks(content, sheet, chunk_rows, usecols)
+
+def read_sample(content, file_type, sheet=None, rows=SAMPLE_ROWS):
+    """The first rows of a statement, read without loading the rest of the file."""
+    def build():
+        chunks = iter_statement_chunks(content, file_type, sheet, chunk_rows=rows)
+        try:
+            return next(chunks, pd.DataFrame())
+        finally:
+            chunks.close()
+    return _cached((file_digest(content), 'sample', file_type, sheet, rows), build)
+
+def _merge_reports(reports):
+    merged = {}
+    for report in reports:
+        for column, entry in report.items():
+            target = merged.setdefault(column, {'failed': 0, 'examples': []})
+            target['failed'] += entry['failed']
+            target['examples'] = (target['examples'] + [e for e in entry['examples'] if e not in target['examples']])[:5]
+    return merged
+
+def _parse_uncached(content, file_type, column_mapping, transaction_type, amount_column, debit_column, credit_column, sheet):
+    frames, reports = [], []
+    # Only the columns the mapping refers to are read
+    usecols = list(dict.fromkeys(col for col in [*column_mapping.values(), amount_column, debit_column, credit_column] if col))
+    for chunk in iter_statement_chunks(content, file_type, sheet, usecols=usecols):
+        parsed, report = normalize_statement(chunk, column_mapping, transaction_type, amount_column, debit_column, credit_column)
+        frames.append(parsed)
+        reports.append(report)
+    parsed_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=FIXED_COLUMNS)
+    typed_df = apply_schema(parsed_df)
+    # Dates are parsed by apply_schema rather than normalize, so their failures are counted here
+    typed_df.attrs['coercion_report'] = {'Date': coercion_entry(parsed_df['Date'], typed_df['Date']), **_merge_reports(reports)}
+    typed_df.attrs['memory'] = {
+        'before': int(parsed_df.memory_usage(deep=True).sum()),
+        'after': int(typed_df.memory_usage(deep=True).sum()),
+    }
+    return typed_df
+
+def _parse_key(content, file_type, column_mapping, transaction_type, amount_column, debit_column, credit_column, sheet):
+    mapping_key = tuple(sorted((key, value or '') for key, value in column_mapping.items()))
+    return (file_digest(content), 'parse', file_type, sheet, mapping_key, transaction_type, amount_column, debit_column, credit_column)
+
+@span('ingest.parse')
+def parse_statement(content, file_type, column_mapping, transaction_type, amount_column=None, debit_column=None, credit_column=None, sheet=None):
+    """Stream a statement through normalization chunk by chunk into the typed standardised schema.
+
+    Only the normalized columns are kept between chunks, so peak memory follows the chunk size.
+    The coercion report is attached as parsed_df.attrs['coercion_report'] and the untyped versus
+    typed memory use as parsed_df.attrs['memory'].
+    """
+    args = (content, file_type, column_mapping, transaction_type, amount_column, debit_column, credit_column, sheet)
+    return _cached(_parse_key(*args), lambda: _parse_uncached(*args))
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Process pool shared by all sessions for parsing several statements at once."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            workers = int(os.environ.get('FINCHART_PARSE_WORKERS', 0)) or min(os.cpu_count() or 1, 4)
+            # spawn avoids forking the server process while its threads hold locks
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+def _reset_executor():
+    """Drop a pool whose workers died so the next batch starts a fresh one."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+def parse_many(files):
+    """Parse several statements in parallel.
+
+    files is a list of (name, content, file_type, options), where options are the keyword arguments of
+    parse_statement. Yields (name, parsed_df, error) as each file finishes; a file that fails yields its
+    exception and does not affect the others.
+    """
+    pending = {}
+    for name, content, file_type, options in files:
+        args = (
+            content, file_type, options['column_mapping'], options['transaction_type'], options.get('amount_column'),
+            options.get('debit_column'), options.get('credit_column'), options.get('sheet'),
+        )
+        cached = parse_cache.get(_parse_key(*args))
+        if cached is not None:
+            yield name, cached.copy(), None
+        else:
+            pending[name] = args
+    if len(pending) == 1:
+        name, args = pending.popitem()
+        try:
+            yield name, parse_statement(*args), None
+        except Exception as e:
+            yield name, None, e
+        return
+    futures = {get_executor().submit(_parse_uncached, *args): (name, args) for name, args in pending.items()}
+    for future in as_completed(futures):
+        name, args = futures[future]
+        try:
+            parsed_df = future.result()
+        except BrokenProcessPool as e:
+            _reset_executor()
+            yield name, None, e
+            continue
+        except Exception as e:
+            yield name, None, e
+            continue
+        parse_cache.put(_parse_key(*args), parsed_df)
+        yield name, parsed_df.copy(), None
@@ -0,0 +1,136 @@
+import re
+import hashlib
+import warnings
+import numpy as np
+import pandas as pd
+from normalize import FIXED_COLUMNS, parse_amounts, parse_crdr
+
+# Header words that point at each target column; 'Debit'/'Credit' are the split amount columns
+HEADER_SYNONYMS = {
+    'Date': ['date', 'transaction date', 'txn date', 'posting date', 'posted', 'value date', 'booking date'],
+    'Description': ['description', 'narration', 'details', 'particulars', 'memo', 'payee', 'merchant', 'remarks', 'transaction details'],
+    'Amount': ['amount', 'amt', 'transaction amount', 'value', 'sum'],
+    'Category': ['category', 'class', 'classification', 'tag'],
+    'crdr': ['cr/dr', 'dr/cr', 'crdr', 'drcr', 'credit/debit', 'debit/credit', 'type', 'transaction type', 'dc'],
+    'Balance': ['balance', 'bal', 'running balance', 'closing balance', 'available balance'],
+    'Debit': ['debit', 'withdrawal', 'withdrawals', 'paid out', 'money out', 'debit amount', 'dr'],
+    'Credit': ['credit', 'deposit', 'deposits', 'paid in', 'money in', 'credit amount', 'cr'],
+}
+# Minimum score for a column to be suggested for a target
+MIN_SCORE = 2.0
+
+
+def _normalize_header(name):
+    return re.sub(r'\s+', ' ', re.sub(r'[^a-z/ ]+', ' ', str(name).lower())).strip()
+
+def header_signature(columns):
+    """Stable key for a statement layout, so a remembered mapping is found again for the same bank export."""
+    return hashlib.sha1('|'.join(_normalize_header(col) for col in columns).encode()).hexdigest()
+
+def _name_score(header, target):
+    synonyms = HEADER_SYNONYMS[target]
+    if header in synonyms:
+        return 3.0
+    words = set(header.replace('/', ' / ').split())
+    return 1.5 if any(set(synonym.split()) <= words for synonym in synonyms) else 0.0
+
+def _date_ratio(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return 1.0
+    if pd.api.types.is_numeric_dtype(values):
+        return 0.0
+    text = values.dropna().astype(str)
+    if text.empty:
+        return 0.0
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        parsed = pd.to_datetime(text, errors='coerce', format='mixed', dayfirst=True)
+    return float(parsed.notna().mean())
+
+def column_features(sample):
+    """Per-column statistics the scores are built from."""
+    features = {}
+    for col in sample.columns:
+        values = sample[col]
+        present = values.notna().sum()
+        amounts, failed = parse_amounts(values)
+        numeric_ratio = float(amounts.notna().sum() / present) if present else 0.0
+        _, crdr_failed = parse_crdr(values)
+        text = values.dropna().astype(str)
+        features[col] = {
+            'header': _normalize_header(col),
+            'numeric': numeric_ratio if not pd.api.types.is_datetime64_any_dtype(values) else 0.0,
+            'date': _date_ratio(values),
+            'negatives': bool((amounts < 0).any()),
+            'positives': bool((amounts > 0).any()),
+            'crdr': float(1 - crdr_failed.sum() / present) if present and not numeric_ratio else 0.0,
+            'distinct': float(text.nunique() / len(text)) if len(text) else 0.0,
+            'length': float(text.str.len().mean()) if len(text) else 0.0,
+            'amounts': amounts,
+        }
+    return features
+
+def _balance_consistency(balance, amount):
+    """Share of rows where the change in balance equals plus or minus the amount."""
+    steps = balance.diff().abs().to_numpy()[1:]
+    size = amount.abs().to_numpy()
+    matches = np.isclose(steps, size[1:], atol=0.011) | np.isclose(steps, size[:-1], atol=0.011)
+    valid = ~np.isnan(steps)
+    return float(matches[valid].mean()) if valid.any() else 0.0
+
+def score_columns(sample):
+    """Score every source column against every target; higher means a better fit."""
+    features = column_features(sample)
+    scores = pd.DataFrame(0.0, index=list(HEADER_SYNONYMS), columns=list(sample.columns))
+    numeric_cols = [col for col, f in features.items() if f['numeric'] > 0.9]
+    for col, f in features.items():
+        for target in HEADER_SYNONYMS:
+            scores.loc[target, col] += _name_score(f['header'], target)
+        is_text = f['numeric'] < 0.5 and f['date'] < 0.5
+        scores.loc['Date', col] += 3 * f['date'] - 2 * (f['numeric'] > 0.9 and f['date'] < 1)
+        scores.loc['Description', col] += (2 * is_text + min(f['length'] / 20, 1) + f['distinct']) if is_text else 0
+        scores.loc['Category', col] += (1 + (f['distinct'] < 0.3)) if is_text and f['crdr'] < 0.9 else 0
+        scores.loc['crdr', col] += 3 * f['crdr'] if f['crdr'] > 0.9 else 0
+        for target in ('Amount', 'Balance', 'Debit', 'Credit'):
+            scores.loc[target, col] += 2 * f['numeric'] if f['date'] < 0.5 else -2
+        scores.loc['Amount', col] += 0.5 * (f['negatives'] and f['positives'])
+        scores.loc['Debit', col] += 0.5 * (f['numeric'] > 0.9 and sample[col].isna().any())
+        scores.loc['Credit', col] += 0.5 * (f['numeric'] > 0.9 and sample[col].isna().any())
+    # A balance column moves by exactly the amount of each transaction
+    for balance in numeric_cols:
+        best = max((_balance_consistency(features[balance]['amounts'], features[amount]['amounts'])
+                    for amount in numeric_cols if amount != balance), default=0.0)
+        scores.loc['Balance', balance] += 3 * best
+    return scores
+
+def infer_mapping(sample):
+    """Suggest the transaction type, amount column(s) and column mapping for a sample of a statement."""
+    scores = score_columns(sample)
+    pairs = scores.stack().sort_values(ascending=False)
+    assigned, used = {}, set()
+    for (target, col), score in pairs.items():
+        if score < MIN_SCORE or target in assigned or col in used:
+            continue
+        assigned[target] = col
+        used.add(col)
+
+    amount = assigned.get('Amount')
+    if assigned.get('Debit') and assigned.get('Credit') and not (amount and assigned.get('crdr')):
+        transaction_type = 'Separate Debit and Credit columns'
+    elif amount and assigned.get('crdr'):
+        transaction_type = 'Debit/Credit'
+    elif amount and (parse_amounts(sample[amount])[0] < 0).any():
+        transaction_type = 'Plus/Minus'
+    else:
+        transaction_type = 'Debit/Credit'
+
+    column_mapping = {target: assigned.get(target) for target in FIXED_COLUMNS}
+    if transaction_type != 'Debit/Credit':
+        column_mapping['crdr'] = None
+    return {
+        'transaction_type': transaction_type,
+        'column_mapping': column_mapping,
+        'amount_column': amount if transaction_type == 'Plus/Minus' else None,
+        'debit_column': assigned.get('Debit') if transaction_type == 'Separate Debit and Credit columns' else None,
+        'credit_column': assigned.get('Credit') if transaction_type == 'Separate Debit and Credit columns' else None,
+    }
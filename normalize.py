@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+
+# Default Columns for Standardised financial data
+FIXED_COLUMNS = ['Date', 'Description', 'Amount', 'Category', 'crdr', 'Balance']
+
+# How the amount and credit/debit status are laid out in a statement
+TRANSACTION_TYPES = ['Debit/Credit', 'Plus/Minus', 'Separate Debit and Credit columns']
+
+# Markers in a credit/debit column, compared in lower case without surrounding spaces or a trailing dot
+CREDIT_MARKERS = ['c', 'cr', 'credit', 'credited', 'deposit']
+DEBIT_MARKERS = ['d', 'dr', 'debit', 'debited', 'withdrawal']
+
+
+def _mask(condition):
+    return condition.fillna(False).astype(bool)
+
+def _is_blank(values):
+    text = values.astype('string').str.strip()
+    return values.isna() | _mask(text == '')
+
+def parse_amounts(values):
+    """Parse amounts like '1,234.50', '(12.00)', '€ 1.234,50', 'Rs. 500', '5.00 DR' into floats.
+
+    Returns the parsed floats and a mask of non-blank values that could not be parsed.
+    """
+    if pd.api.types.is_bool_dtype(values):
+        values = values.astype(object)
+    if pd.api.types.is_numeric_dtype(values):
+        parsed = values.astype(float)
+        return parsed, pd.Series(False, index=values.index)
+    text = values.astype('string').str.strip()
+    upper = text.str.upper()
+    negative = _mask(
+        text.str.startswith('(') & text.str.endswith(')')
+        | text.str.contains('-', regex=False)
+        | upper.str.contains(r'DR\.?$', regex=True)
+    )
+    # Words such as 'Rs.' or 'Cr.' go first, so their dots are not read as decimal points
+    digits = text.str.replace(r'[^\W\d_]+\.?|[^\d.,]', '', regex=True)
+    # A comma followed by one or two trailing digits is a decimal comma ('1.234,50', '12,5')
+    decimal_comma = _mask(digits.str.contains(r',\d{1,2}$', regex=True))
+    cleaned = digits.str.replace(',', '', regex=False).where(
+        ~decimal_comma,
+        digits.str.replace('.', '', regex=False).str.replace(',', '.', regex=False),
+    )
+    parsed = pd.to_numeric(cleaned.replace('', pd.NA), errors='coerce').astype(float)
+    parsed = parsed.where(~negative, -parsed.abs())
+    failed = parsed.isna() & ~_is_blank(values)
+    return parsed, failed
+
+def parse_crdr(values):
+    """Map credit/debit markers such as 'CR', 'Deposit', 'Dr.' onto 'Credit'/'Debit'; any other value is reported as failed."""
+    marker = values.astype('string').str.strip().str.lower().str.rstrip('.')
+    crdr = pd.Series(np.select([_mask(marker.isin(CREDIT_MARKERS)), _mask(marker.isin(DEBIT_MARKERS))], ['Credit', 'Debit'], default=None), index=values.index, dtype=object)
+    failed = crdr.isna() & ~_is_blank(values)
+    return crdr, failed
+
+def _report_entry(values, failed):
+    return {'failed': int(failed.sum()), 'examples': values[failed].astype(str).unique()[:5].tolist()}
+
+def coercion_entry(values, parsed):
+    """Report entry for a column coerced elsewhere, e.g. dates typed by the schema: non-blank values that came out missing."""
+    return _report_entry(values, parsed.isna() & ~_is_blank(values))
+
+def normalize_statement(data, column_mapping, transaction_type, amount_column=None, debit_column=None, credit_column=None):
+    """Turn a mapped statement into the FIXED_COLUMNS schema using vectorized operations only.
+
+    Returns the standardised frame and a per-column report of values that could not be coerced.
+    """
+    parsed_df = pd.DataFrame(index=data.index, columns=FIXED_COLUMNS)
+    report = {}
+    for key in ('Date', 'Description', 'Category'):
+        if column_mapping.get(key):
+            parsed_df[key] = data[column_mapping[key]]
+
+    if transaction_type == 'Separate Debit and Credit columns':
+        debit, debit_failed = parse_amounts(data[debit_column])
+        credit, credit_failed = parse_amounts(data[credit_column])
+        report['Debit'] = _report_entry(data[debit_column], debit_failed)
+        report['Credit'] = _report_entry(data[credit_column], credit_failed)
+        debit, credit = debit.abs(), credit.abs()
+        is_credit = credit.fillna(0) > 0
+        is_debit = ~is_credit & (debit.fillna(0) > 0)
+        parsed_df['Amount'] = credit.where(is_credit, debit.where(is_debit, np.nan))
+        parsed_df['crdr'] = np.select([is_credit, is_debit], ['Credit', 'Debit'], default=None)
+    else:
+        amount_source = amount_column if transaction_type == 'Plus/Minus' else column_mapping.get('Amount')
+        if amount_source:
+            amount, failed = parse_amounts(data[amount_source])
+            report['Amount'] = _report_entry(data[amount_source], failed)
+            if transaction_type == 'Plus/Minus' or not column_mapping.get('crdr'):
+                parsed_df['crdr'] = np.where(amount.isna(), None, np.where(amount > 0, 'Credit', 'Debit'))
+            parsed_df['Amount'] = amount.abs()
+        if transaction_type != 'Plus/Minus' and column_mapping.get('crdr'):
+            crdr, failed = parse_crdr(data[column_mapping['crdr']])
+            report['crdr'] = _report_entry(data[column_mapping['crdr']], failed)
+            parsed_df['crdr'] = crdr
+
+    if column_mapping.get('Balance'):
+        balance, failed = parse_amounts(data[column_mapping['Balance']])
+        report['Balance'] = _report_entry(data[column_mapping['Balance']], failed)
+        parsed_df['Balance'] = balance
+    return parsed_df.reset_index(drop=True), report
+
+def report_frame(report):
+    """Coercion report as a table for display."""
+    return pd.DataFrame(
+        [{'Column': column, 'Failed': entry['failed'], 'Examples': ', '.join(entry['examples'])} for column, entry in report.items()],
+        columns=['Column', 'Failed', 'Examples'],
+    )
@@ -1,37 +1,35 @@
-import base64
 import os
-import time
 import pandas as pd
-import numpy as np
-import plotly.express as px
 import streamlit as st
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
-from streamlit_extras.dataframe_explorer import dataframe_explorer
-import openpyxl
-import uuid
 from custom_functions import *
+from db import get_collection
+from storage import store_file, combine_files
+from rollups import build_rollups
+from explorer import render_explorer
+from ingest import read_sample, parse_many, excel_sheets, file_digest, SAMPLE_ROWS
+from mapping import infer_mapping, header_signature
+from categorize import apply_categories
+from dedup import FingerprintIndex, load_fingerprint_index, save_fingerprint_index
+from normalize import FIXED_COLUMNS, TRANSACTION_TYPES, report_frame
+from timing import span, begin_rerun
+from pipeline import find_outputs, load_output
 
 #st.set_page_config(layout="wide", initial_sidebar_state='collapsed')
 
 # Database Connection
-DB_uri = (
-    f"mongodb+srv://{st.secrets['DB_USERNAME']}:{st.secrets['DB_PASSWORD']}"
-    f"@{st.secrets['DB_HOST']}/?retryWrites=true&w=majority&appName=Log"
-)
-client = MongoClient(DB_uri, server_api=ServerApi('1'))
-log = client['logs']['log']
+log = get_collection('logs.log')
+fingerprint_collection = get_collection('finchart.fingerprints')
 
 # Initialize log
 if 'log' not in st.session_state:
     initialize_log()
+begin_rerun()
 
 # Default Columns for Standardised financial data
-st.session_state.fixed_columns = ['Date', 'Description', 'Amount', 'Category', 'crdr', 'Balance']
+st.session_state.fixed_columns = list(FIXED_COLUMNS)
 columns = st.session_state.fixed_columns
 
 st.session_state.parsed_df = None
-parsed_df = pd.DataFrame(columns=st.session_state.fixed_columns)
 
 st.session_state.col_map_dict = {col: None for col in columns}
 st.session_state.log_status = False
@@ -41,46 +39,170 @@ flex_buttons()
 # Navbar
 navbar()
 
+# Statements processed offline by pipeline.py are loaded as they are instead of being parsed again
+processed_outputs = find_outputs(os.environ.get('FINCHART_DATA_DIR'))
+if processed_outputs:
+    with st.expander('Load statements processed offline', expanded=False):
+        output_name = st.selectbox("Processed dataset", list(processed_outputs), key='processed_output')
+        if st.button("Load dataset"):
+            if 'uploaded_files' not in st.session_state:
+                st.session_state.uploaded_files = {}
+            with span('upload.load_output'):
+                st.session_state.uploaded_files.update(load_output(processed_outputs[output_name]))
+                combine_files(st.session_state.uploaded_files)
+            log_action("Loaded processed dataset", details={'dataset': output_name})
+            update_log_in_db(log)
+            st.switch_page("pages/2_Charts.py")
+
 st.markdown("### Please Upload your Transactions below to continue")
 log_action("Displayed upload prompt")
 update_log_in_db(log)
-# Upload File
-file = st.file_uploader(
+# Upload Files
+files = st.file_uploader(
     'Upload your Transactions here',
     type=['csv', 'xlsx'],
     help="All files are processed in your browser and not uploaded to any server",
-    accept_multiple_files=False,
+    accept_multiple_files=True,
     key='uploaded_file',
     label_visibility='collapsed'
 )
 
-# Check if file is uploaded
-if file is not None:
-    log_action(f"File uploaded: {file.name}")
+@span('upload.process_files')
+def process_files(file_options):
+    """Parse, categorize and deduplicate every file, then store the results for the Charts page.
+
+    file_options maps each file name to (content, file_type, parse options, header signature).
+    """
+    try:
+        progress = st.progress(0.0, text=f"Parsing {len(file_options)} file(s)")
+        parsed_files = {}
+        dedup_summary = []
+        coercion_failed = False
+        # Fingerprints of rows already uploaded, persisted per user when logged in
+        persist_fingerprints = st.session_state.get('logged_in') and st.session_state.get('username') not in (None, 'Guest')
+        if st.session_state.get('fingerprint_index') is None:
+            st.session_state.fingerprint_index = (
+                load_fingerprint_index(st.session_state.username, fingerprint_collection)
+                if persist_fingerprints else FingerprintIndex()
+            )
+        fingerprint_index = st.session_state.fingerprint_index
+        results = {}
+        for done, (name, parsed_df, error) in enumerate(parse_many([(name, content, file_type, options) for name, (content, file_type, options, _) in file_options.items()]), start=1):
+            progress.progress(done / len(file_options), text=f"Parsed {name} ({done}/{len(file_options)})")
+            results[name] = (parsed_df, error)
+        # Files finish parsing in any order; they are deduplicated in upload order so the same uploads keep the same rows
+        for name in file_options:
+            parsed_df, error = results[name]
+            if error is not None:
+                st.error(f"Could not parse {name}: {error}")
+                log_error(f"Could not parse {name}: {error}")
+                continue
+            coercion_report = parsed_df.attrs.get('coercion_report', {})
+            if any(entry['failed'] for entry in coercion_report.values()):
+                coercion_failed = True
+                st.warning(f"Some values in {name} could not be converted and were left empty")
+                st.dataframe(report_frame(coercion_report), use_container_width=True)
+                log_action("Values failed coercion", details={'file_name': name, **{key: entry['failed'] for key, entry in coercion_report.items()}})
+            memory = parsed_df.attrs.get('memory')
+            if memory:
+                log_action("Typed parsed data", details={'file_name': name, 'bytes_before': memory['before'], 'bytes_after': memory['after']})
+            with span('upload.categorize'):
+                parsed_df = apply_categories(parsed_df, st.session_state.get('category_rules'))
+            with span('upload.dedup'):
+                parsed_df, dropped = fingerprint_index.add(file_digest(file_options[name][0]), parsed_df)
+            dedup_summary.append({'File': name, 'Rows kept': len(parsed_df), 'Duplicates dropped': dropped})
+            with span('upload.store'):
+                store_file(name, processed=parsed_df, files=st.session_state.uploaded_files, rollups=build_rollups(parsed_df))
+            parsed_files[name] = parsed_df
+            st.session_state.setdefault('processed_uploads', {})[(name, file_digest(file_options[name][0]))] = file_options[name][2]
+            # Remember the mapping for this statement layout so the next upload skips the form
+            _, _, options, signature = file_options[name]
+            st.session_state.saved_mappings[signature] = {key: value for key, value in options.items() if key != 'sheet'}
+        if not parsed_files:
+            update_log_in_db(log)
+            st.stop()
+        if persist_fingerprints:
+            with span('upload.save_fingerprints'):
+                save_fingerprint_index(
+                    st.session_state.username, fingerprint_index, fingerprint_collection,
+                    [file_digest(file_options[name][0]) for name in parsed_files]
+                )
+        duplicates_dropped = sum(row['Duplicates dropped'] for row in dedup_summary)
+        if duplicates_dropped:
+            st.info(f"Dropped {duplicates_dropped} transaction(s) already present in other uploaded statements")
+            st.dataframe(pd.DataFrame(dedup_summary), use_container_width=True, hide_index=True)
+            log_action("Dropped duplicate transactions", details={'summary': dedup_summary})
+        with span('upload.combine'):
+            combine_files(st.session_state.uploaded_files)
+        parsed_df = parsed_files.get(file.name, next(iter(parsed_files.values())))
+        st.session_state.log.update({'parsed_data_status': 'Data Parsed Successfully'})
+        st.session_state.log.update({'col_map_dict': file_options.get(file.name, next(iter(file_options.values())))[2]['column_mapping']})
+        st.session_state.parsed_df = parsed_df
+        log_action("Mapped columns and parsed data successfully", details={'files': list(parsed_files)})
+        update_log_in_db(log)
+        #try_log(log) # Commented out to avoid errors
+        # Stay on this page while there are dropped duplicates or unconverted values to review
+        if len(parsed_files) == len(file_options) and not duplicates_dropped and not coercion_failed:
+            st.switch_page("pages/2_Charts.py")
+        st.page_link("pages/2_Charts.py", label="Continue to Charts")
+    except KeyError as e:
+        st.session_state.log.update({'error': f"KeyError in mapping columns: {e}"})
+        st.error(f"KeyError in mapping columns: {e}")
+        log_error(f"KeyError in mapping columns: {e}")
+        update_log_in_db(log)
+    except TypeError as e:
+        st.session_state.log.update({'error': f"TypeError in mapping columns: {e}"})
+        st.error(f"TypeError in mapping columns: {e}")
+        log_error(f"TypeError in mapping columns: {e}")
+        update_log_in_db(log)
+    except Exception as e:
+        st.session_state.log.update({'error': f"Unexpected error in mapping columns: {e}"})
+        st.error(f"Unexpected error in mapping columns: {e}")
+        log_error(f"Unexpected error in mapping columns: {e}")
+        update_log_in_db(log)
+
+def select_index(options, value):
+    """Position of value in options for prefilling a widget, or None."""
+    return options.index(value) if value in options else None
+
+# Check if files are uploaded
+if files:
+    log_action(f"Files uploaded: {', '.join(f.name for f in files)}")
     update_log_in_db(log)
 
-    # Detect File Type
-    if file.type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-        file_type = 'xlsx'
-    elif file.type == 'text/csv':
-        file_type = 'csv'
+    # Detect File Types
+    file_types = {f.name: 'xlsx' if f.name.lower().endswith('.xlsx') else 'csv' for f in files}
+
+    # Preview one file to choose the column mapping; the mapping is applied to every file with the same layout
+    file = files[0]
+    if len(files) > 1:
+        preview_name = st.selectbox("Select a file to preview and map columns", [f.name for f in files], key='preview_file')
+        file = next(f for f in files if f.name == preview_name)
+    file_type = file_types[file.name]
 
-    # Load Data
+    # Load a sample of the data; the full file is only read once the mapping is known
     try:
-        data = pd.read_csv(file) if file_type == 'csv' else pd.read_excel(file)
+        content = file.getvalue()
+        sheet = None
+        if file_type == 'xlsx':
+            sheets = excel_sheets(content)
+            if len(sheets) > 1:
+                sheet = st.selectbox("Select the sheet that holds the transactions", sheets, key='sheet')
+        with span('upload.read_sample'):
+            data = read_sample(content, file_type, sheet)
         data_columns = list(data.columns)
-        data_types = list(data.dtypes.to_list())
-        log_action(f"Data loaded with {len(data)} rows and {len(data.columns)} columns")
+        log_action(f"Sample loaded with {len(data)} rows and {len(data.columns)} columns")
         update_log_in_db(log)
     except Exception as e:
         st.error(f"Error loading data: {e}")
         log_error(f"Error loading data: {e}")
         update_log_in_db(log)
+        st.stop()
 
-    # Save the uploaded file in session state
     if 'uploaded_files' not in st.session_state:
         st.session_state.uploaded_files = {}
-    st.session_state.uploaded_files[file.name] = {'raw': data.to_dict('records'), 'processed': None}
+    if 'saved_mappings' not in st.session_state:
+        st.session_state.saved_mappings = {}
 
     # Check if data is there
     if data.empty:
@@ -89,22 +211,63 @@ if file is not None:
         update_log_in_db(log)
     else:
         num_rows, num_cols = data.shape
-        st.toast(f"Data Loaded Successfully with {num_rows} rows and {num_cols} columns", icon='✅')
-        log_action(f"Data Loaded Successfully with {num_rows} rows and {num_cols} columns")
-        update_log_in_db(log)
+        st.toast(f"Previewing the first {num_rows} rows and {num_cols} columns", icon='✅')
+
+        # Files whose header layout has been mapped before are parsed straight away
+        signatures = {}
+        with span('upload.signatures'):
+            for f in files:
+                f_sheet = sheet if f.name == file.name else None
+                signatures[f.name] = header_signature(read_sample(f.getvalue(), file_types[f.name], f_sheet).columns)
+        signature = signatures[file.name]
+        saved_mappings = st.session_state.saved_mappings
+        if all(sig in saved_mappings for sig in signatures.values()) and not st.session_state.get('edit_mapping'):
+            st.info("Recognised the layout of your statement(s); parsing with your saved column mapping.")
+            if st.button("Change column mapping"):
+                st.session_state.edit_mapping = True
+                st.rerun()
+            file_options = {
+                f.name: (f.getvalue(), file_types[f.name], dict(saved_mappings[signatures[f.name]], sheet=sheet if f.name == file.name else None), signatures[f.name])
+                for f in files
+            }
+            # Files already parsed with the same mapping are left as stored, so reruns do not process them again
+            processed = st.session_state.get('processed_uploads', {})
+            pending = {name: value for name, value in file_options.items() if processed.get((name, file_digest(value[0]))) != value[2]}
+            if pending:
+                log_action("Parsed with saved column mapping")
+                process_files(pending)
+            else:
+                st.page_link("pages/2_Charts.py", label="Continue to Charts")
+            st.stop()
+
+        with span('upload.infer_mapping'):
+            suggested = saved_mappings.get(signature) or infer_mapping(data)
 
         discover_data_view = st.expander('Click here to view and discover data', expanded=False)
         with discover_data_view:
-            st.dataframe(dataframe_explorer(data, case=False), use_container_width=True)
+            st.caption(f"Showing the first {SAMPLE_ROWS} rows")
+            with span('upload.explorer'):
+                render_explorer(data, ('sample', file_digest(file.getvalue()), sheet), 'sample_explorer')
 
-        # Ask user about Type of File in the uploaded file: Debit/Credit or +/-
+        # Keyword rules used to fill in Category when the statement has none
+        with st.expander('Categorization rules', expanded=False):
+            st.caption("Transactions without a category are labelled by the first keyword found in their description. Your rules are checked before the built-in ones.")
+            edited_rules = st.data_editor(
+                pd.DataFrame(st.session_state.get('category_rules', []), columns=['keyword', 'category']),
+                num_rows='dynamic', use_container_width=True, key='category_rules_editor'
+            )
+            st.session_state.category_rules = edited_rules.dropna().to_dict('records')
+
+        # Ask user about Type of File in the uploaded file: Debit/Credit, +/- or separate Debit and Credit columns
         transaction_posted_type = st.radio(
             "Select the Type of File in the Uploaded Data to continue",
-            ['Debit/Credit', 'Plus/Minus'],
+            TRANSACTION_TYPES,
             key='file_type',
             horizontal=True,
-            index=None
+            index=select_index(TRANSACTION_TYPES, suggested['transaction_type'])
         )
+        amount_column_name = debit_column_name = credit_column_name = None
+        derived_columns = []
 
         if transaction_posted_type == 'Plus/Minus':
             st.markdown(
@@ -118,94 +281,70 @@ if file is not None:
                 key='amount_column',
                 placeholder="Select the Column that represents Amount",
                 label_visibility='collapsed',
-                index=None
+                index=select_index(data_columns, suggested['amount_column'] or suggested['column_mapping'].get('Amount'))
             )
-
             if amount_column_name is not None:
-                try:
-                    data['cr/dr'] = data[amount_column_name].apply(lambda x: 'Credit' if x > 0 else 'Debit')
-                    data[amount_column_name] = data[amount_column_name].apply(lambda x: x if x > 0 else -x)
-                    st.toast("Adding Column cr/dr as Credit/Debit")
-                    log_action("Added Column cr/dr as Credit/Debit")
-                    update_log_in_db(log)
-                except KeyError as e:
-                    st.error(f"KeyError in Adding Column cr/dr: {e}")
-                    log_error(f"KeyError in Adding Column cr/dr: {e}")
-                    update_log_in_db(log)
-                except TypeError as e:
-                    st.error(f"TypeError in Adding Column cr/dr: {e}")
-                    log_error(f"TypeError in Adding Column cr/dr: {e}")
-                    update_log_in_db(log)
-                except Exception as e:
-                    st.error(f"Unexpected error in Adding Column cr/dr: {e}")
-                    log_error(f"Unexpected error in Adding Column cr/dr: {e}")
-                    update_log_in_db(log)
+                derived_columns = ['Amount', 'crdr']
+                log_action("Selected signed amount column", details={'amount_column': amount_column_name})
+                update_log_in_db(log)
+            ready = amount_column_name is not None
+
+        elif transaction_posted_type == 'Separate Debit and Credit columns':
+            st.markdown("##### Please select the columns that hold Debit and Credit amounts")
+            split_cols = st.columns(2)
+            debit_column_name = split_cols[0].selectbox("Debit column", data_columns, key='debit_column', index=select_index(data_columns, suggested['debit_column']))
+            credit_column_name = split_cols[1].selectbox("Credit column", data_columns, key='credit_column', index=select_index(data_columns, suggested['credit_column']))
+            ready = debit_column_name is not None and credit_column_name is not None
+            if ready:
+                derived_columns = ['Amount', 'crdr']
+                log_action("Selected debit and credit columns", details={'debit_column': debit_column_name, 'credit_column': credit_column_name})
+                update_log_in_db(log)
 
         elif transaction_posted_type == 'Debit/Credit':
-            amount_column_name = 'Amount'
-            st.session_state.amount_column_name = amount_column_name
             log_action("Transaction posted type is Debit/Credit")
             update_log_in_db(log)
+            ready = True
         else:
-            amount_column_name = None
+            ready = False
 
-        if amount_column_name is not None:
+        if ready:
             # Ask User to map columns to existing column template
             st.markdown("#### Map Columns to existing column template")
             log_action("Prompted user to map columns")
             update_log_in_db(log)
 
             with st.form(key='column_mapping_form'):
-                num_cols = len(columns)
-                cols = st.columns(num_cols)
-
-                data_columns = list(data.columns)
-                data_types = list(data.dtypes.to_list())
                 rows = [st.columns([0.2, 0.2, 0.8]) for _ in range(len(columns))]
                 for i, row in enumerate(rows):
                     row[0].write(f"{columns[i]} maps to:")
-                    if columns[i] == 'crdr' and transaction_posted_type == 'Plus/Minus':
-                        col_name = row[1].selectbox(
-                            f"{columns[i]} maps to:", data_columns, key=i, label_visibility='collapsed',
-                            index=len(data_columns) - 1, disabled=True,
-                            help="This column is automatically added based on the Amount Column"
+                    if columns[i] in derived_columns:
+                        row[1].selectbox(
+                            f"{columns[i]} maps to:", ["Derived automatically"], key=i, label_visibility='collapsed',
+                            disabled=True, help="This column is derived from the selected amount column(s)"
                         )
-                    else:
-                        col_name = row[1].selectbox(f"{columns[i]} maps to:", data_columns, key=i, label_visibility='collapsed', index=None)
+                        continue
+                    col_name = row[1].selectbox(
+                        f"{columns[i]} maps to:", data_columns, key=i, label_visibility='collapsed',
+                        index=select_index(data_columns, suggested['column_mapping'].get(columns[i]))
+                    )
                     if col_name:
                         st.session_state.col_map_dict[columns[i]] = col_name
 
                 submit_button = st.form_submit_button(label='Map Columns and show charts')
 
             if submit_button:
-                try:
-                    for key, value in st.session_state.col_map_dict.items():
-                        if value != "":
-                            parsed_df[key] = data[value]
-                    st.session_state.log.update({'parsed_data_status': 'Data Parsed Successfully'})
-                    st.session_state.log.update({'col_map_dict': st.session_state.col_map_dict})
-                    st.session_state.parsed_df = parsed_df
-                    st.session_state.uploaded_files[file.name]['processed'] = parsed_df.to_dict('records')
-                    st.button(
-                        "Continue to Charts", key='Continue to Charts',
-                        help="Click to continue to the next page to view the charts", on_click=None
+                st.session_state.edit_mapping = False
+                options = {
+                    'column_mapping': dict(st.session_state.col_map_dict), 'transaction_type': transaction_posted_type,
+                    'amount_column': amount_column_name, 'debit_column': debit_column_name, 'credit_column': credit_column_name,
+                }
+                # Other layouts use their own saved mapping when there is one, otherwise the mapping from this form
+                process_files({
+                    f.name: (
+                        f.getvalue(), file_types[f.name],
+                        dict(options, sheet=sheet) if f.name == file.name
+                        else dict(saved_mappings.get(signatures[f.name]) if signatures[f.name] != signature and signatures[f.name] in saved_mappings else options, sheet=None),
+                        signatures[f.name]
                     )
-                    log_action("Mapped columns and parsed data successfully")
-                    update_log_in_db(log)
-                    #try_log(log) # Commented out to avoid errors
-                    st.switch_page("pages/2_Charts.py")
-                except KeyError as e:
-                    st.session_state.log.update({'error': f"KeyError in mapping columns: {e}"})
-                    st.error(f"KeyError in mapping columns: {e}")
-                    log_error(f"KeyError in mapping columns: {e}")
-                    update_log_in_db(log)
-                except TypeError as e:
-                    st.session_state.log.update({'error': f"TypeError in mapping columns: {e}"})
-                    st.error(f"TypeError in mapping columns: {e}")
-                    log_error(f"TypeError in mapping columns: {e}")
-                    update_log_in_db(log)
-                except Exception as e:
-                    st.session_state.log.update({'error': f"Unexpected error in mapping columns: {e}"})
-                    st.error(f"Unexpected error in mapping columns: {e}")
-                    log_error(f"Unexpected error in mapping columns: {e}")
-                    update_log_in_db(log)
\ No newline at end of file
+                    for f in files
+                })
@@ -1,22 +1,15 @@
 import streamlit as st
-import plotly.express as px
-import pandas as pd
-import numpy as np
-from streamlit_extras.dataframe_explorer import dataframe_explorer
-from streamlit_option_menu import option_menu
-import openpyxl
-import base64
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 from custom_functions import *
+from db import get_collection
+from storage import to_frame, load_rollups, COMBINED_NAME
+from schema import apply_schema, has_schema
+from explorer import render_explorer
+from timing import span, begin_rerun
+from charts import category_totals, amount_histogram, scatter_sample, cached_figure
+from analytics import get_analytics, ROLLING_WINDOWS, TOP_MERCHANTS
 
 # Database Connection
-DB_uri = (
-    f"mongodb+srv://{st.secrets['DB_USERNAME']}:{st.secrets['DB_PASSWORD']}"
-    f"@{st.secrets['DB_HOST']}/?retryWrites=true&w=majority&appName=Log"
-)
-client = MongoClient(DB_uri, server_api=ServerApi('1'))
-log = client['logs']['log']
+log = get_collection('logs.log')
 
 flex_buttons()
 navbar()
@@ -24,6 +17,72 @@ navbar()
 # Initialize log if not already initialized
 if 'log' not in st.session_state:
     initialize_log()
+begin_rerun()
+
+
+# Figures for each chart section; plotly is imported by the page once there is data to plot
+def balance_figure(analytics, start, end):
+    figure = px.line(analytics.running_balance(start, end), x='Date', y=['Reconstructed', 'Statement'], title='Balance Over Time')
+    figure.update_layout(yaxis_title='Balance', legend_title_text='')
+    return figure
+
+def category_figure(totals):
+    return px.bar(totals, x='Category', y='Amount', title='Amount by Category', color='Category')
+
+def credit_debit_figure(crdr_totals):
+    return px.pie(crdr_totals, names='Type', values='Count', title='Credit vs Debit')
+
+def scatter_figure(transactions):
+    return px.scatter(scatter_sample(transactions), x='Amount', y='Balance', title='Amount vs Balance', color='Category', render_mode='webgl')
+
+def histogram_figure(transactions):
+    histogram = amount_histogram(transactions)
+    figure = px.bar(histogram, x='Amount', y='Count', title='Amount Distribution')
+    figure.update_traces(width=histogram['Width'])
+    figure.update_layout(bargap=0)
+    return figure
+
+def rolling_figure(rolling, window):
+    return px.line(rolling, x='Date', y='Spend', color='Category', title=f'Spend over the previous {window} days')
+
+def periods_figure(periods):
+    figure = px.bar(periods, x='Month', y=['Income', 'Spend'], barmode='group', title='Income and Spend per Month')
+    figure.update_layout(yaxis_title='Amount', legend_title_text='')
+    return figure
+
+def merchants_figure(merchants):
+    figure = px.bar(merchants, x='Spend', y='Merchant', orientation='h', title=f'Top {TOP_MERCHANTS} Merchants by Spend')
+    figure.update_layout(yaxis={'categoryorder': 'total ascending'})
+    return figure
+
+
+def show_figure(chart, figure_key, build):
+    """Draw a chart from the figure cache, building it only for a new dataset version, filter state or chart."""
+    with span(f'charts.{chart}'):
+        try:
+            payload = cached_figure(figure_key + (chart,) if figure_key else None, build)
+            st.plotly_chart(go.Figure(payload), use_container_width=True)
+        except Exception as e:
+            st.error(f"Error displaying charts: {e}")
+            log_error(f"Error displaying charts: {e}", details={'chart': chart})
+            update_log_in_db(log)
+
+# Each section is a fragment, so a widget inside one reruns only that section
+@st.fragment
+def chart_section(heading, chart, figure_key, build):
+    st.markdown(f"#### {heading}")
+    show_figure(chart, figure_key, build)
+
+@st.fragment
+def rolling_section(analytics, start, end, figure_key, selected_file):
+    st.markdown("#### Rolling Spend by Category")
+    window = st.selectbox("Window", ROLLING_WINDOWS, index=1, format_func=lambda days: f"{days} days", key=f'window_{selected_file}')
+    show_figure(f'rolling_{window}', figure_key, lambda: rolling_figure(analytics.rolling_spend(window, start, end), window))
+
+@st.fragment
+def explorer_section(df, index_key, widget_key):
+    with span('charts.explorer'):
+        render_explorer(df, index_key, widget_key)
 
 # Check if Session State has uploaded files
 if 'uploaded_files' not in st.session_state or not st.session_state.uploaded_files:
@@ -34,13 +93,17 @@ if 'uploaded_files' not in st.session_state or not st.session_state.uploaded_fil
     
 else:
     # Allow user to select which file to view
-    file_names = list(st.session_state.uploaded_files.keys())
+    file_names = sorted(st.session_state.uploaded_files.keys(), key=lambda name: name != COMBINED_NAME)
     selected_file = st.selectbox("Select a file to view charts", file_names)
 
     if selected_file:
         processed_data = st.session_state.uploaded_files[selected_file]['processed']
         if processed_data is not None:
-            df = pd.DataFrame(processed_data)
+            with span('charts.load'):
+                df = to_frame(processed_data)
+                # Data saved before typed storage is typed on load
+                if not has_schema(df):
+                    df = apply_schema(df)
             st.session_state.parsed_df = df
 
             if st.session_state.log_id is not None:
@@ -48,7 +111,9 @@ else:
 
             # Display the dataframe
             st.markdown("### Parsed Data")
-            st.dataframe(dataframe_explorer(df, case=False), use_container_width=True)
+            # Shared indexes are keyed on the dataset version; an entry without one is indexed for this run only
+            version = st.session_state.uploaded_files[selected_file].get('version')
+            explorer_section(df, (selected_file, version) if version else None, f'explorer_{selected_file}')
 
             # Check if the DataFrame has the necessary columns
             required_columns = ['Date', 'Balance', 'Amount', 'Category', 'crdr']
@@ -57,32 +122,53 @@ else:
                 st.markdown("### Charts and Graphs")
 
                 try:
-                    # Line chart for Balance over time
-                    st.markdown("#### Balance Over Time")
-                    fig_balance = px.line(df, x='Date', y='Balance', title='Balance Over Time')
-                    st.plotly_chart(fig_balance, use_container_width=True)
+                    # plotly is only loaded once there is something to plot
+                    import plotly.express as px
+                    import plotly.graph_objects as go
+
+                    # Daily aggregates are built once per dataset version; a date range only slices them
+                    entry = st.session_state.uploaded_files[selected_file]
+                    with span('charts.analytics'):
+                        analytics = get_analytics((selected_file, version) if version else None, df)
+                    first_day, last_day = analytics.bounds()
+                    if first_day is None:
+                        start, end = None, None
+                    else:
+                        chosen = st.date_input("Date range", (first_day, last_day), min_value=first_day, max_value=last_day, key=f'range_{selected_file}')
+                        start, end = (chosen[0], chosen[1]) if len(chosen) == 2 else (first_day, last_day)
+                    full_range = (start, end) == (first_day, last_day)
 
-                    # Bar chart for Amount by Category
-                    st.markdown("#### Amount by Category")
-                    fig_amount_category = px.bar(df, x='Category', y='Amount', title='Amount by Category', color='Category')
-                    st.plotly_chart(fig_amount_category, use_container_width=True)
+                    # Figures are cached per dataset version and date range; entries saved without a version are not cached
+                    figure_key = ((selected_file, version), (start, end)) if version else None
+
+                    # Line chart for Balance over time, rebuilt from the amounts for statements without a reliable balance
+                    chart_section("Balance Over Time", 'balance', figure_key, lambda: balance_figure(analytics, start, end))
+
+                    # Bar chart for Amount by Category; over the whole dataset it reads the precomputed rollups
+                    chart_section("Amount by Category", 'category', figure_key, lambda: category_figure(
+                        category_totals(load_rollups(entry)['monthly_category']) if full_range else analytics.category_totals(start, end)
+                    ))
 
                     # Pie chart for Credit vs Debit
-                    st.markdown("#### Credit vs Debit")
-                    credit_debit_counts = df['crdr'].value_counts().reset_index()
-                    credit_debit_counts.columns = ['Type', 'Count']
-                    fig_credit_debit = px.pie(credit_debit_counts, names='Type', values='Count', title='Credit vs Debit')
-                    st.plotly_chart(fig_credit_debit, use_container_width=True)
+                    chart_section("Credit vs Debit", 'credit_debit', figure_key, lambda: credit_debit_figure(
+                        load_rollups(entry)['crdr'] if full_range else analytics.crdr_totals(start, end)
+                    ))
 
                     # Scatter plot for Amount vs Balance
-                    st.markdown("#### Amount vs Balance")
-                    fig_amount_balance = px.scatter(df, x='Amount', y='Balance', title='Amount vs Balance', color='Category')
-                    st.plotly_chart(fig_amount_balance, use_container_width=True)
+                    chart_section("Amount vs Balance", 'scatter', figure_key, lambda: scatter_figure(analytics.rows(df, start, end)))
 
                     # Histogram for Amount distribution
-                    st.markdown("#### Amount Distribution")
-                    fig_amount_dist = px.histogram(df, x='Amount', title='Amount Distribution')
-                    st.plotly_chart(fig_amount_dist, use_container_width=True)
+                    chart_section("Amount Distribution", 'histogram', figure_key, lambda: histogram_figure(analytics.rows(df, start, end)))
+
+                    # Rolling spend per category over a trailing window chosen inside the section
+                    rolling_section(analytics, start, end, figure_key, selected_file)
+
+                    # Month-over-month and year-over-year changes
+                    chart_section("Monthly Comparison", 'periods', figure_key, lambda: periods_figure(analytics.period_comparison(start, end)))
+                    st.dataframe(analytics.period_comparison(start, end), use_container_width=True, hide_index=True, column_config={'Month': st.column_config.DateColumn(format='MMM YYYY')})
+
+                    # Merchants with the highest spend
+                    chart_section("Top Merchants", 'merchants', figure_key, lambda: merchants_figure(analytics.top_merchants(start, end)))
 
                     log_action("Displayed charts for selected file", details={'file_name': selected_file})
                     update_log_in_db(log)
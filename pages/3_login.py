@@ -1,18 +1,13 @@
 import streamlit as st
-from pymongo.mongo_client import MongoClient
-from pymongo.server_api import ServerApi
 import hashlib
-import pandas as pd
 from custom_functions import *
+from db import get_collection
+from timing import begin_rerun, span
+from sample import load_sample
 
 # Database Connection
-DB_uri = (
-    f"mongodb+srv://{st.secrets['DB_USERNAME']}:{st.secrets['DB_PASSWORD']}"
-    f"@{st.secrets['DB_HOST']}/?retryWrites=true&w=majority&appName=Log"
-)
-client = MongoClient(DB_uri, server_api=ServerApi('1'))
-users_collection = client['finchart']['users']
-session_collection = client['finchart']['sessions']
+users_collection = get_collection('finchart.users')
+session_collection = get_collection('finchart.sessions')
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -99,6 +94,7 @@ def main():
         
         cols = st.columns(4)
         if cols[0].button("Logout"):
+            flush_log()
             st.session_state.logged_in = False
             st.session_state.clear()
             st.rerun()
@@ -110,6 +106,7 @@ def main():
             retrieve_session_state(st.session_state.username,session_collection)
             
         if cols[3].button("Clear Session State and logout"):
+            flush_log()
             st.session_state.logged_in = False
             st.session_state.clear()
             st.rerun()
@@ -130,8 +127,11 @@ def main():
                 elif option == "Continue as Guest with Sample Data":
                     st.session_state.logged_in = True
                     st.session_state.username = "Guest"
-                    retrieve_session_state("Guest",session_collection)
+                    # The sample ships with the app, so guests never wait on the database
+                    with span('login.load_sample'):
+                        st.session_state.uploaded_files = load_sample()
                     st.switch_page("pages/2_Charts.py")
 
 if __name__ == "__main__":
+    begin_rerun()
     main()
\ No newline at end of file
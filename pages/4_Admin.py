@@ -0,0 +1,74 @@
+import os
+import streamlit as st
+import pandas as pd
+from custom_functions import *
+from db import pool_stats
+from ingest import parse_cache
+from charts import figure_cache
+from timing import span_stats, profile_report, TIMING_ENABLED
+
+def admin_users():
+    """Usernames allowed on this page from st.secrets or FINCHART_ADMINS; empty means no one."""
+    try:
+        users = st.secrets.get('ADMIN_USERS', '')
+    except Exception:
+        users = ''
+    users = users or os.environ.get('FINCHART_ADMINS', '')
+    return {user.strip() for user in users.split(',') if user.strip()}
+
+allowed = admin_users()
+if st.session_state.get('username') not in allowed:
+    st.error("This page is only available to administrators." if allowed else "No administrators are configured (set ADMIN_USERS or FINCHART_ADMINS).")
+    st.stop()
+
+st.markdown("### Performance")
+if not TIMING_ENABLED:
+    st.info("Timing spans are switched off (FINCHART_TIMING=0).")
+
+# Percentiles over every session in this process
+st.markdown("#### Timing spans")
+summary = pd.DataFrame(span_stats.summary())
+if summary.empty:
+    st.write("No spans recorded yet.")
+else:
+    st.dataframe(summary, use_container_width=True, hide_index=True)
+if st.button("Reset span statistics"):
+    span_stats.clear()
+    st.rerun()
+
+# Span totals of this session
+totals = st.session_state.get('span_totals', {})
+if totals:
+    st.markdown("#### Slowest spans in this session")
+    rows = [{'Span': name, 'Count': entry['count'], 'Total (ms)': round(entry['total_ms'], 2), 'Mean (ms)': round(entry['total_ms'] / entry['count'], 2),
+             'Max (ms)': round(entry['max_ms'], 2)} for name, entry in totals.items()]
+    st.dataframe(pd.DataFrame(rows).sort_values('Total (ms)', ascending=False).head(20), use_container_width=True, hide_index=True)
+
+st.markdown("#### Resources")
+cols = st.columns(4)
+with cols[0]:
+    st.caption("Database pool")
+    st.json(pool_stats())
+with cols[1]:
+    st.caption("Log writer")
+    st.json(get_log_sink().stats())
+with cols[2]:
+    st.caption("Parse cache")
+    st.json(parse_cache.stats())
+with cols[3]:
+    st.caption("Figure cache")
+    st.json(figure_cache.stats())
+
+# Profiling is kept in the session rather than a widget key so it survives switching pages
+st.markdown("#### Profiler")
+st.session_state.profile_reruns = st.toggle(
+    "Profile each page rerun", value=st.session_state.get('profile_reruns', False),
+    help="Runs cProfile during the timed stages of every rerun of the other pages. Adds overhead while on."
+)
+profiler = st.session_state.get('rerun_profiler')
+if profiler is not None:
+    report = profile_report(profiler)
+    st.caption("Last profiled rerun, by cumulative time")
+    st.code(report or "Nothing was profiled in the last rerun.", language=None)
+elif st.session_state.profile_reruns:
+    st.write("Open another page to profile its next rerun.")
@@ -0,0 +1,231 @@
+"""Batch ingest of a directory of statements outside Streamlit.
+
+    python pipeline.py statements/ --mapping mapping.json --out processed/
+
+The mapping file holds either one column mapping, as saved by the Upload page
+({"transaction_type": ..., "column_mapping": {...}, "amount_column": ...}), or an object of such
+mappings keyed by header signature for folders mixing several bank layouts. Statements are parsed
+in parallel, categorized and deduplicated like uploads, and written as a Parquet dataset
+partitioned by source file together with the chart rollups of every file and of all files combined.
+The Upload page loads this output directly when FINCHART_DATA_DIR points at it or its parent.
+"""
+import os
+import sys
+import json
+import shutil
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+
+# File types the pipeline reads, by extension
+STATEMENT_TYPES = {'.csv': 'csv', '.xlsx': 'xlsx'}
+MANIFEST_NAME = 'manifest.json'
+TRANSACTIONS_DIR = 'transactions'
+ROLLUPS_DIR = 'rollups'
+# Columns kept as Arrow dictionaries so they load as pandas categoricals
+CATEGORICAL_COLUMNS = ['Category', 'crdr']
+
+
+def load_mapping(path):
+    """Read a mapping file as {header signature or None: mapping}; None applies to every layout."""
+    with open(path) as f:
+        mapping = json.load(f)
+    return {None: mapping} if 'column_mapping' in mapping else mapping
+
+def discover_statements(directory):
+    """Statement files directly inside a directory, sorted by name."""
+    return sorted(
+        name for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in STATEMENT_TYPES and os.path.isfile(os.path.join(directory, name))
+    )
+
+def mapping_for(content, file_type, mappings):
+    """The mapping for a statement's layout, or None when the mapping file has none for it."""
+    from ingest import read_sample
+    from mapping import header_signature
+    if None in mappings:
+        return mappings[None]
+    return mappings.get(header_signature(read_sample(content, file_type).columns))
+
+def process_directory(directory, mappings, category_rules=None):
+    """Parse, categorize and deduplicate every statement in a directory.
+
+    Returns the stored files as the Upload page keeps them in st.session_state.uploaded_files,
+    including the combined dataset, and a {name: error} dict of files that could not be processed.
+    """
+    from ingest import parse_many, file_digest
+    from categorize import apply_categories
+    from dedup import FingerprintIndex
+    from rollups import build_rollups
+    from storage import store_file, combine_files
+
+    jobs, errors = [], {}
+    for name in discover_statements(directory):
+        with open(os.path.join(directory, name), 'rb') as f:
+            content = f.read()
+        file_type = STATEMENT_TYPES[os.path.splitext(name)[1].lower()]
+        options = mapping_for(content, file_type, mappings)
+        if options is None:
+            errors[name] = 'no column mapping for this statement layout'
+            continue
+        jobs.append((name, content, file_type, options))
+
+    parsed = {}
+    for name, parsed_df, error in parse_many(jobs):
+        if error is not None:
+            errors[name] = str(error)
+        else:
+            parsed[name] = parsed_df
+
+    # Files are deduplicated in name order so the same folder always keeps the same rows
+    files = {}
+    fingerprint_index = FingerprintIndex()
+    contents = {name: content for name, content, _, _ in jobs}
+    for name in sorted(parsed):
+        parsed_df = apply_categories(parsed[name], category_rules)
+        parsed_df, _ = fingerprint_index.add(file_digest(contents[name]), parsed_df)
+        store_file(name, processed=parsed_df, files=files, rollups=build_rollups(parsed_df))
+    combine_files(files)
+    return files, errors
+
+def _slug(name):
+    return hashlib.sha1(name.encode()).hexdigest()[:16]
+
+def _dictionary_type():
+    import pyarrow as pa
+    return pa.dictionary(pa.int32(), pa.string())
+
+def _shared_dictionaries(table):
+    """Give every categorical column one dictionary type, so tables from different files concatenate."""
+    import pyarrow as pa
+    fields = [pa.field(field.name, _dictionary_type()) if pa.types.is_dictionary(field.type) else field for field in table.schema]
+    return table.cast(pa.schema(fields))
+
+def _categorical(table):
+    """Dictionary-encode the categorical columns of output written with them as plain strings."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    for name in CATEGORICAL_COLUMNS:
+        if name in table.column_names and not pa.types.is_dictionary(table.schema.field(name).type):
+            table = table.set_column(table.column_names.index(name), name, pc.dictionary_encode(table[name]).cast(_dictionary_type()))
+    return table
+
+def write_output(files, output_dir, overwrite=False):
+    """Write stored files as a Parquet dataset partitioned by Source, plus rollups and a manifest."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from storage import COMBINED_NAME, load_rollups, to_table
+
+    if os.path.exists(os.path.join(output_dir, MANIFEST_NAME)):
+        if not overwrite:
+            raise FileExistsError(f"{output_dir} already holds processed output")
+        for subdir in (TRANSACTIONS_DIR, ROLLUPS_DIR):
+            shutil.rmtree(os.path.join(output_dir, subdir), ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    sources = [name for name in files if name != COMBINED_NAME]
+    tables = []
+    for name in sources:
+        table = _shared_dictionaries(files[name]['processed'])
+        tables.append(table.append_column('Source', pa.array([name] * table.num_rows, pa.string())))
+    if tables:
+        ds.write_dataset(
+            pa.concat_tables(tables, promote_options='default'), os.path.join(output_dir, TRANSACTIONS_DIR), format='parquet',
+            partitioning=ds.partitioning(pa.schema([('Source', pa.string())]), flavor='hive'),
+            file_options=ds.ParquetFileFormat().make_write_options(compression='zstd'),
+        )
+
+    manifest = {'created': datetime.now().isoformat(timespec='seconds'), 'files': {}}
+    for name, entry in files.items():
+        slug = _slug(name)
+        os.makedirs(os.path.join(output_dir, ROLLUPS_DIR, slug), exist_ok=True)
+        rollups = {}
+        for kind, frame in load_rollups(entry).items():
+            rollups[kind] = os.path.join(ROLLUPS_DIR, slug, f'{kind}.parquet')
+            pq.write_table(to_table(frame), os.path.join(output_dir, rollups[kind]), compression='zstd')
+        manifest['files'][name] = {'rows': files[name]['processed'].num_rows, 'rollups': rollups, 'version': entry.get('version')}
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+def _read_output(output_dir, stamp):
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from storage import COMBINED_NAME
+
+    with open(os.path.join(output_dir, MANIFEST_NAME)) as f:
+        manifest = json.load(f)
+    transactions = _categorical(ds.dataset(os.path.join(output_dir, TRANSACTIONS_DIR), format='parquet', partitioning='hive').to_table())
+    files = {}
+    for name, info in manifest['files'].items():
+        if name == COMBINED_NAME:
+            table = transactions
+        else:
+            table = transactions.filter(pc.equal(transactions['Source'], name)).drop_columns(['Source'])
+        rollups = {kind: pq.read_table(os.path.join(output_dir, path)) for kind, path in info['rollups'].items()}
+        files[name] = {'raw': None, 'processed': table, 'rollups': rollups, 'version': info.get('version') or f'{stamp}:{name}'}
+    if COMBINED_NAME in files:
+        files[COMBINED_NAME]['sources'] = {name: files[name]['version'] for name in files if name != COMBINED_NAME}
+    return files
+
+def load_output(output_dir):
+    """Stored files from a pipeline output directory, ready for st.session_state.uploaded_files.
+
+    Tables are read once per process and shared; each call returns fresh entry dicts so a session
+    can add or replace files without affecting others.
+    """
+    stamp = os.path.getmtime(os.path.join(output_dir, MANIFEST_NAME))
+    key = os.path.abspath(output_dir)
+    with _loaded_lock:
+        cached = _loaded.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = _loaded[key] = (stamp, _read_output(output_dir, stamp))
+    return {name: dict(entry, rollups=dict(entry['rollups'])) for name, entry in cached[1].items()}
+
+def find_outputs(data_dir):
+    """Pipeline output directories at or directly below data_dir, by display name."""
+    if not data_dir or not os.path.isdir(data_dir):
+        return {}
+    if os.path.exists(os.path.join(data_dir, MANIFEST_NAME)):
+        return {os.path.basename(os.path.normpath(data_dir)): data_dir}
+    return {
+        name: os.path.join(data_dir, name) for name in sorted(os.listdir(data_dir))
+        if os.path.exists(os.path.join(data_dir, name, MANIFEST_NAME))
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('directory', help='folder of CSV/XLSX statements')
+    parser.add_argument('--mapping', required=True, help='column mapping JSON file')
+    parser.add_argument('--out', required=True, help='output directory')
+    parser.add_argument('--rules', help='JSON list of {"keyword", "category"} categorization rules')
+    parser.add_argument('--workers', type=int, help='parsing processes (default: up to 4)')
+    parser.add_argument('--overwrite', action='store_true', help='replace existing output in --out')
+    args = parser.parse_args()
+
+    if args.workers:
+        os.environ['FINCHART_PARSE_WORKERS'] = str(args.workers)
+    rules = None
+    if args.rules:
+        with open(args.rules) as f:
+            rules = json.load(f)
+    files, errors = process_directory(args.directory, load_mapping(args.mapping), rules)
+    for name, error in errors.items():
+        print(f"Skipped {name}: {error}", file=sys.stderr)
+    if not files:
+        sys.exit("No statements could be processed")
+    try:
+        manifest = write_output(files, args.out, args.overwrite)
+    except FileExistsError as e:
+        sys.exit(f"{e}; pass --overwrite to replace it")
+    for name, info in manifest['files'].items():
+        print(f"{name}: {info['rows']} rows")
+    sys.exit(1 if errors else 0)
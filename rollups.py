@@ -0,0 +1,53 @@
+import pandas as pd
+
+# Rollups kept for every dataset; charts read these instead of the raw transactions
+ROLLUP_NAMES = ['daily', 'monthly_category', 'crdr']
+
+
+def _rollup_frame(df):
+    """Row-level columns the rollups are summed from, in statement order with undated rows dropped."""
+    amount = pd.to_numeric(df['Amount'], errors='coerce').fillna(0.0)
+    crdr = df['crdr'].astype(object)
+    frame = pd.DataFrame({
+        'Date': pd.to_datetime(df['Date'], errors='coerce').dt.normalize(),
+        'Balance': pd.to_numeric(df['Balance'], errors='coerce'),
+        'Inflow': amount.where(crdr == 'Credit', 0.0),
+        'Outflow': amount.where(crdr == 'Debit', 0.0),
+        'Amount': amount,
+        'Category': df['Category'].astype(object).where(df['Category'].notna(), 'Uncategorised'),
+        'crdr': crdr.where(crdr.notna(), 'Unknown'),
+    })
+    return frame.dropna(subset=['Date'])
+
+def build_rollups(df):
+    """Daily balance and flows, monthly amounts per category and type, and credit/debit totals."""
+    frame = _rollup_frame(df).sort_values('Date', kind='stable')
+    daily = frame.groupby('Date').agg(
+        Balance=('Balance', 'last'), Inflow=('Inflow', 'sum'), Outflow=('Outflow', 'sum'), Count=('Amount', 'size')
+    ).reset_index()
+    frame['Month'] = frame['Date'].dt.to_period('M').dt.to_timestamp()
+    monthly_category = frame.groupby(['Month', 'Category', 'crdr']).agg(
+        Amount=('Amount', 'sum'), Count=('Amount', 'size')
+    ).reset_index()
+    crdr = frame.groupby('crdr').agg(Count=('Amount', 'size'), Amount=('Amount', 'sum')).reset_index().rename(columns={'crdr': 'Type'})
+    return {'daily': daily, 'monthly_category': monthly_category, 'crdr': crdr}
+
+def update_rollups(rollups, new_df):
+    """Fold newly appended transactions into existing rollups, touching only the periods they cover.
+
+    Flows and counts are added; a day's closing balance comes from the newer statement when both cover it.
+    """
+    added = build_rollups(new_df)
+    old_daily = rollups['daily'].set_index('Date')
+    new_daily = added['daily'].set_index('Date')
+    overlap = old_daily.index.intersection(new_daily.index)
+    daily = pd.concat([old_daily.drop(overlap), new_daily.drop(overlap)])
+    if len(overlap):
+        merged = old_daily.loc[overlap, ['Inflow', 'Outflow', 'Count']] + new_daily.loc[overlap, ['Inflow', 'Outflow', 'Count']]
+        merged['Balance'] = new_daily.loc[overlap, 'Balance'].combine_first(old_daily.loc[overlap, 'Balance'])
+        daily = pd.concat([daily, merged[daily.columns]])
+    monthly_category = pd.concat([rollups['monthly_category'], added['monthly_category']]).groupby(
+        ['Month', 'Category', 'crdr'], as_index=False
+    )[['Amount', 'Count']].sum()
+    crdr = pd.concat([rollups['crdr'], added['crdr']]).groupby('Type', as_index=False)[['Count', 'Amount']].sum()
+    return {'daily': daily.sort_index().reset_index(), 'monthly_category': monthly_category, 'crdr': crdr}
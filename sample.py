@@ -0,0 +1,76 @@
+"""Sample statement shipped with the app for "Continue as Guest with Sample Data".
+
+The transactions and their chart rollups are stored as uncompressed Arrow IPC files, memory-mapped
+once per process and shared read-only by every guest session. Rebuild them with
+
+    python sample.py
+"""
+import os
+import sys
+import threading
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'sample')
+# Name the sample is listed under on the Charts page
+SAMPLE_NAME = 'Sample statement.csv'
+# Generated statement size: a couple of years of everyday spending
+SAMPLE_ROWS = 3650
+SAMPLE_DAYS = 730
+SAMPLE_SEED = 5
+SAMPLE_OPENING_BALANCE = 15000.0
+
+_sample = None
+_sample_lock = threading.Lock()
+
+
+def _read_ipc(path):
+    import pyarrow as pa
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+def _load_tables():
+    from rollups import ROLLUP_NAMES
+    processed = _read_ipc(os.path.join(SAMPLE_DIR, 'transactions.arrow'))
+    rollups = {kind: _read_ipc(os.path.join(SAMPLE_DIR, f'{kind}.arrow')) for kind in ROLLUP_NAMES}
+    return processed, rollups
+
+def load_sample():
+    """The sample as stored files for st.session_state.uploaded_files, without any database access.
+
+    The memory-mapped tables are shared; each call returns fresh entry dicts for the session to own.
+    """
+    global _sample
+    with _sample_lock:
+        if _sample is None:
+            _sample = _load_tables()
+    processed, rollups = _sample
+    return {SAMPLE_NAME: {'raw': None, 'processed': processed, 'rollups': dict(rollups), 'version': 'sample'}}
+
+def build_sample(output_dir=SAMPLE_DIR):
+    """Generate the sample statement, run it through the upload pipeline and write the IPC files."""
+    import pyarrow as pa
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+    from generate_statements import LAYOUTS, generate_statement, to_layout
+    from ingest import parse_statement
+    from categorize import apply_categories
+    from rollups import build_rollups
+    from storage import to_table
+
+    layout = 'debit_credit'
+    transactions = generate_statement(SAMPLE_ROWS, seed=SAMPLE_SEED, start='2023-01-01', opening_balance=SAMPLE_OPENING_BALANCE, days=SAMPLE_DAYS)
+    content = to_layout(transactions, layout).to_csv(index=False).encode()
+    mapping = LAYOUTS[layout]['mapping']
+    parsed_df = apply_categories(parse_statement(content, 'csv', mapping['column_mapping'], mapping['transaction_type']))
+    tables = {'transactions': to_table(parsed_df)}
+    tables.update({kind: to_table(frame) for kind, frame in build_rollups(parsed_df).items()})
+    os.makedirs(output_dir, exist_ok=True)
+    for name, table in tables.items():
+        # Uncompressed so the file can be memory-mapped without decoding
+        with pa.OSFile(os.path.join(output_dir, f'{name}.arrow'), 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+    return tables
+
+
+if __name__ == '__main__':
+    for name, table in build_sample().items():
+        print(f"{name}: {table.num_rows} rows")
@@ -0,0 +1,93 @@
+import re
+import threading
+import warnings
+import numpy as np
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Dtypes of the standardised transactions frame
+SCHEMA = {
+    'Date': 'datetime64[ns]',
+    'Description': 'string[pyarrow]',
+    'Amount': 'float64',
+    'Category': 'category',
+    'crdr': 'category',
+    'Balance': 'float64',
+}
+# Values used to choose between day-first and month-first formats
+DATE_SAMPLE_ROWS = 200
+
+_date_formats = {}
+_date_formats_lock = threading.Lock()
+
+
+def _date_shape(text):
+    """'31/01/2024' -> 'dd/dd/dddd', the key under which its inferred format is cached."""
+    return re.sub(r'\d', 'd', re.sub(r'[A-Za-z]+', 'a', text))
+
+def infer_date_format(values, refresh=False):
+    """Guess the strftime format of a column of date strings, caching it per date shape."""
+    sample = values.dropna().astype(str).str.strip()
+    sample = sample[sample != '']
+    # Spread the sample over the whole column so day-first dates past the 12th are seen
+    sample = sample.iloc[np.unique(np.linspace(0, len(sample) - 1, min(len(sample), DATE_SAMPLE_ROWS)).astype(int))] if len(sample) else sample
+    if sample.empty:
+        return None
+    shape = _date_shape(sample.iloc[0])
+    with _date_formats_lock:
+        if shape in _date_formats and not refresh:
+            return _date_formats[shape]
+    candidates = {guess_datetime_format(sample.iloc[0], dayfirst=False), guess_datetime_format(sample.iloc[0], dayfirst=True)} - {None}
+    best, best_parsed = None, 0
+    for fmt in sorted(candidates):
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum()
+        if parsed > best_parsed:
+            best, best_parsed = fmt, parsed
+    with _date_formats_lock:
+        _date_formats[shape] = best
+    return best
+
+def parse_dates(values):
+    """Convert a Date column to datetime64 using one cached format instead of per-value parsing."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values.astype('datetime64[ns]')
+    if values.dtype == object and values.map(type).eq(pd.Timestamp).all():
+        return pd.to_datetime(values)
+    text = values.astype('string').str.strip()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        # A cached format from another export with the same shape may not fit; re-infer once before giving up
+        for refresh in (False, True):
+            fmt = infer_date_format(text, refresh=refresh)
+            if fmt is None:
+                break
+            parsed = pd.to_datetime(text, format=fmt, errors='coerce')
+            if parsed.notna().sum() >= text.notna().sum() * 0.9:
+                return parsed
+        return pd.to_datetime(text, format='mixed', errors='coerce')
+
+def apply_schema(df, minor_units=False):
+    """Cast the standardised columns to SCHEMA; with minor_units, Amount and Balance become integer cents."""
+    typed = df.copy()
+    for column, dtype in SCHEMA.items():
+        if column not in typed.columns:
+            continue
+        if column == 'Date':
+            typed[column] = parse_dates(typed[column])
+        elif column in ('Amount', 'Balance'):
+            values = pd.to_numeric(typed[column], errors='coerce').astype('float64')
+            typed[column] = values.mul(100).round().astype('Int64') if minor_units else values
+        elif dtype == 'category':
+            typed[column] = typed[column].astype(object).where(typed[column].notna(), None).astype('category')
+        else:
+            typed[column] = typed[column].astype(object).where(typed[column].notna(), None).astype(dtype)
+    typed.attrs = dict(df.attrs)
+    return typed
+
+def has_schema(df):
+    """Whether a frame already carries the typed Date and categorical columns, i.e. apply_schema has run."""
+    categorical = [column for column, dtype in SCHEMA.items() if dtype == 'category' and column in df.columns]
+    return (
+        'Date' in df.columns and pd.api.types.is_datetime64_any_dtype(df['Date'])
+        and all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in categorical)
+    )
@@ -0,0 +1,199 @@
+import io
+import uuid
+import hashlib
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson.binary import Binary
+from pymongo.errors import BulkWriteError
+from schema import apply_schema, has_schema
+from rollups import build_rollups, update_rollups
+
+DATASET_KEY = '__dataset__'
+# Arrow string types kept as Arrow-backed pandas strings when converting back to pandas
+ARROW_STRING_TYPES = {pa.string(): pd.StringDtype('pyarrow'), pa.large_string(): pd.StringDtype('pyarrow')}
+# Name under which all processed files are offered together on the Charts page
+COMBINED_NAME = 'All files (combined)'
+# Rows per content-addressed chunk; appending rows only rewrites the trailing chunk
+CHUNK_ROWS = 50000
+
+
+def to_table(data):
+    """Convert a DataFrame, a list of records or an Arrow table into an Arrow table."""
+    data = resolve(data)
+    if data is None or isinstance(data, pa.Table):
+        return data
+    if isinstance(data, list):
+        data = pd.DataFrame(data)
+    try:
+        return pa.Table.from_pandas(data, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed-type object columns from loosely typed exports are stored as strings
+        data = data.copy()
+        for col in data.columns:
+            if data[col].dtype == object:
+                data[col] = data[col].astype(str).where(data[col].notna(), None)
+        return pa.Table.from_pandas(data, preserve_index=False)
+
+def to_frame(table):
+    """Convert a stored Arrow table back into a DataFrame, reusing Arrow buffers where possible."""
+    table = resolve(table)
+    if table is None or isinstance(table, pd.DataFrame):
+        return table
+    if isinstance(table, list):
+        return pd.DataFrame(table)
+    # Strings stay Arrow-backed instead of becoming Python objects
+    return table.to_pandas(split_blocks=True, self_destruct=False, types_mapper=ARROW_STRING_TYPES.get)
+
+def store_file(name, raw=None, processed=None, files=None, rollups=None):
+    """Save the raw and processed data of an uploaded file in columnar form, with its chart rollups."""
+    entry = files.setdefault(name, {'raw': None, 'processed': None})
+    if raw is not None:
+        entry['raw'] = to_table(raw)
+    if processed is not None:
+        entry['processed'] = to_table(processed)
+        # Lets the combined dataset tell which files changed since it was built
+        entry['version'] = uuid.uuid4().hex
+        entry['rollups'] = None
+    if rollups is not None:
+        entry['rollups'] = {key: to_table(value) for key, value in rollups.items()}
+    return entry
+
+def load_rollups(entry):
+    """Rollups of a stored entry as DataFrames, building and keeping them for data stored before rollups existed."""
+    if entry.get('rollups') is None:
+        df = to_frame(entry['processed'])
+        entry['rollups'] = {key: to_table(value) for key, value in build_rollups(df if has_schema(df) else apply_schema(df)).items()}
+    return {key: to_frame(value) for key, value in entry['rollups'].items()}
+
+def _source_frames(files, names):
+    return [to_frame(files[name]['processed']).assign(Source=name) for name in names]
+
+def combine_files(files):
+    """Merge every processed file into one combined dataset, tagging rows with their Source file.
+
+    When files were only added since the last merge, their rows are appended and folded into the
+    existing rollups; any other change rebuilds the combined dataset.
+    """
+    names = [name for name, entry in files.items() if name != COMBINED_NAME and entry.get('processed') is not None]
+    versions = {name: files[name].get('version') for name in names}
+    previous = files.pop(COMBINED_NAME, None)
+    if len(names) <= 1:
+        return None
+    sources = (previous or {}).get('sources') or {}
+    appendable = (
+        previous is not None and previous.get('rollups') is not None and sources
+        and all(name in versions and versions[name] == version for name, version in sources.items())
+    )
+    added = [name for name in names if name not in sources]
+    if appendable and not added:
+        files[COMBINED_NAME] = previous
+        return previous
+    if appendable:
+        new_rows = apply_schema(pd.concat(_source_frames(files, added), ignore_index=True))
+        combined = pd.concat([to_frame(previous['processed']), new_rows], ignore_index=True)
+        rollups = update_rollups(load_rollups(previous), new_rows)
+    else:
+        combined = pd.concat(_source_frames(files, names), ignore_index=True)
+        rollups = None
+    combined = apply_schema(combined)
+    combined['Source'] = combined['Source'].astype('category')
+    entry = store_file(COMBINED_NAME, processed=combined, files=files, rollups=rollups if rollups is not None else build_rollups(combined))
+    entry['sources'] = versions
+    return entry
+
+def table_to_parquet(table, compression='zstd'):
+    """Serialize an Arrow table into a compressed Parquet buffer."""
+    buffer = io.BytesIO()
+    pq.write_table(table, buffer, compression=compression)
+    return buffer.getvalue()
+
+def parquet_to_table(data):
+    """Read a Parquet buffer back into an Arrow table."""
+    return pq.read_table(pa.BufferReader(data))
+
+def table_chunks(table, chunk_rows=CHUNK_ROWS):
+    """Split a table into row slices of at most chunk_rows, always yielding at least one."""
+    if table.num_rows == 0:
+        yield table
+        return
+    for offset in range(0, table.num_rows, chunk_rows):
+        yield table.slice(offset, chunk_rows)
+
+def save_dataset(table, chunk_collection, chunk_rows=CHUNK_ROWS, stats=None):
+    """Store a table as hashed Parquet chunks, uploading only chunks not already stored."""
+    payloads = {}
+    digests = []
+    for chunk in table_chunks(table, chunk_rows):
+        data = table_to_parquet(chunk)
+        digest = hashlib.sha256(data).hexdigest()
+        payloads[digest] = data
+        digests.append(digest)
+    existing = {doc['_id'] for doc in chunk_collection.find({'_id': {'$in': list(payloads)}}, {'_id': 1})}
+    missing = [{'_id': digest, 'data': Binary(data), 'size': len(data)} for digest, data in payloads.items() if digest not in existing]
+    if missing:
+        try:
+            chunk_collection.insert_many(missing, ordered=False)
+        except BulkWriteError as e:
+            # Another session may have stored the same chunk meanwhile
+            if any(error['code'] != 11000 for error in e.details.get('writeErrors', [])):
+                raise
+    if stats is not None:
+        stats['chunks'] = stats.get('chunks', 0) + len(digests)
+        stats['uploaded'] = stats.get('uploaded', 0) + len(missing)
+        stats['bytes'] = stats.get('bytes', 0) + sum(doc['size'] for doc in missing)
+    return {'chunks': digests, 'rows': table.num_rows}
+
+def load_dataset(manifest, chunk_collection):
+    """Fetch the chunks of a stored dataset and reassemble the original table."""
+    docs = {doc['_id']: doc['data'] for doc in chunk_collection.find({'_id': {'$in': manifest['chunks']}})}
+    missing = [digest for digest in manifest['chunks'] if digest not in docs]
+    if missing:
+        raise KeyError(f"Missing {len(missing)} chunk(s) for stored dataset")
+    return pa.concat_tables([parquet_to_table(bytes(docs[digest])) for digest in manifest['chunks']])
+
+
+class LazyDataset:
+    """A stored dataset restored from the cloud, fetched on first use instead of at login."""
+
+    def __init__(self, manifest, chunk_collection):
+        self.manifest = manifest
+        self.chunk_collection = chunk_collection
+        self._table = None
+
+    @property
+    def loaded(self):
+        return self._table is not None
+
+    def load(self):
+        if self._table is None:
+            self._table = load_dataset(self.manifest, self.chunk_collection)
+        return self._table
+
+
+def resolve(value):
+    """Return the Arrow table behind a stored value, fetching lazy datasets if needed."""
+    return value.load() if isinstance(value, LazyDataset) else value
+
+def encode_value(value, chunk_collection, stats=None):
+    """Replace tables and frames nested in a session value with chunked dataset manifests."""
+    if isinstance(value, LazyDataset):
+        return {DATASET_KEY: dict(value.manifest)}
+    if isinstance(value, pa.Table):
+        return {DATASET_KEY: save_dataset(value, chunk_collection, stats=stats)}
+    if isinstance(value, pd.DataFrame):
+        manifest = save_dataset(to_table(value), chunk_collection, stats=stats)
+        manifest['frame'] = True
+        return {DATASET_KEY: manifest}
+    if isinstance(value, dict):
+        return {key: encode_value(item, chunk_collection, stats) for key, item in value.items()}
+    return value
+
+def decode_value(value, chunk_collection):
+    """Undo encode_value; tables and frames come back as LazyDataset, fetched when first used."""
+    if isinstance(value, dict):
+        if DATASET_KEY in value:
+            # Frames are read back through to_frame like tables, so they are not fetched at login either
+            return LazyDataset(value[DATASET_KEY], chunk_collection)
+        return {key: decode_value(item, chunk_collection) for key, item in value.items()}
+    return value
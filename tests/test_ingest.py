@@ -0,0 +1,45 @@
+import pandas as pd
+from ingest import detect_header_row, read_sample, iter_csv_chunks, parse_statement
+
+
+def test_header_with_blank_cell_beats_data_rows():
+    rows = [
+        ['', 'Date', 'Description', 'Amount'],
+        ['0', '01/01/2024', 'Coffee shop', '-3.50'],
+        ['1', '02/01/2024', 'Salary', '2500.00'],
+    ]
+    assert detect_header_row(rows) == 0
+
+def test_header_below_preamble():
+    rows = [
+        ['Account statement'],
+        ['Period', '01/01/2024', '31/01/2024'],
+        [],
+        ['Date', 'Narration', 'Withdrawal', 'Deposit', 'Balance'],
+        ['01 Jan 2024', 'TESCO STORE 12', '(12.00)', '', '1,234.50'],
+    ]
+    assert detect_header_row(rows) == 3
+
+def test_typed_excel_cells_are_not_headers():
+    rows = [
+        ['Date', None, 'Amount'],
+        [pd.Timestamp('2024-01-01'), 'Coffee', -3.5],
+    ]
+    assert detect_header_row(rows) == 0
+
+def test_csv_exported_with_index():
+    frame = pd.DataFrame({'Date': ['01/01/2024', '02/01/2024'], 'Description': ['Coffee shop', 'Salary'], 'Amount': [-3.5, 2500.0]})
+    sample = read_sample(frame.to_csv().encode(), 'csv')
+    assert list(sample.columns[1:]) == ['Date', 'Description', 'Amount']
+    assert len(sample) == 2
+
+def test_csv_blank_lines_are_not_rows():
+    content = b'Date,Description,Amount\n01/01/2024,Coffee shop,-3.50\n\n02/01/2024,Salary,2500.00\n\n'
+    chunks = list(iter_csv_chunks(content))
+    assert sum(len(chunk) for chunk in chunks) == 2
+    assert not any(chunk.isna().all(axis=1).any() for chunk in chunks)
+
+def test_unparsed_dates_are_reported():
+    content = b'Date,Description,Amount\n01/01/2024,Coffee shop,-3.50\nPending,Salary,2500.00\n,Refund,1.00\n'
+    parsed = parse_statement(content, 'csv', {'Date': 'Date', 'Description': 'Description'}, 'Plus/Minus', amount_column='Amount')
+    assert parsed.attrs['coercion_report']['Date'] == {'failed': 1, 'examples': ['Pending']}
@@ -0,0 +1,23 @@
+import pandas as pd
+from normalize import parse_amounts, parse_crdr
+
+
+def test_currency_prefix_dot_is_not_a_decimal_point():
+    parsed, failed = parse_amounts(pd.Series(['Rs. 500', 'Rs.1,250.75', 'INR 99']))
+    assert parsed.tolist() == [500.0, 1250.75, 99.0]
+    assert not failed.any()
+
+def test_credit_debit_suffixes():
+    parsed, failed = parse_amounts(pd.Series(['10.00 Cr.', '5.00 DR', '7.50 Dr.']))
+    assert parsed.tolist() == [10.0, -5.0, -7.5]
+    assert not failed.any()
+
+def test_amount_formats():
+    parsed, failed = parse_amounts(pd.Series(['1,234.50', '(12.00)', '€ 1.234,50', '-3', '', None, 'n/a']))
+    assert parsed.iloc[:4].tolist() == [1234.5, -12.0, 1234.5, -3.0]
+    assert failed.tolist() == [False, False, False, False, False, False, True]
+
+def test_crdr_markers():
+    crdr, failed = parse_crdr(pd.Series(['CR', 'Deposit', 'credit', 'Dr.', 'Withdrawal', 'D', 'Dividend', '', None]))
+    assert crdr.tolist() == ['Credit', 'Credit', 'Credit', 'Debit', 'Debit', 'Debit', None, None, None]
+    assert failed.tolist() == [False, False, False, False, False, False, True, False, False]
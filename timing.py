@@ -0,0 +1,108 @@
+import io
+import os
+import time
+import pstats
+import cProfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+# Spans can be switched off entirely with FINCHART_TIMING=0
+TIMING_ENABLED = os.environ.get('FINCHART_TIMING', '1') != '0'
+# Most recent durations kept per span name for the percentiles
+SPAN_WINDOW = 1000
+# Functions listed from a rerun profile, by cumulative time
+PROFILE_LINES = 40
+
+
+class SpanStats:
+    """Process-wide recent durations per span name, summarised as percentiles."""
+
+    def __init__(self, window=SPAN_WINDOW):
+        self.window = window
+        self._durations = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self._lock:
+            self._durations.setdefault(name, deque(maxlen=self.window)).append(seconds)
+            self._counts[name] = self._counts.get(name, 0) + 1
+
+    def summary(self):
+        """One row per span: total count and p50/p90/p99/max over the recent window, in milliseconds."""
+        import numpy as np
+        with self._lock:
+            durations = {name: np.array(values) * 1000 for name, values in self._durations.items()}
+            counts = dict(self._counts)
+        rows = []
+        for name in sorted(durations):
+            p50, p90, p99 = np.percentile(durations[name], [50, 90, 99])
+            rows.append({'Span': name, 'Count': counts[name], 'p50 (ms)': round(float(p50), 2), 'p90 (ms)': round(float(p90), 2),
+                         'p99 (ms)': round(float(p99), 2), 'Max (ms)': round(float(durations[name].max()), 2)})
+        return rows
+
+    def clear(self):
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+
+
+span_stats = SpanStats()
+_local = threading.local()
+
+
+def _session():
+    """The running session's state, or None outside a Streamlit script thread."""
+    return st.session_state if get_script_run_ctx(suppress_warning=True) is not None else None
+
+def begin_rerun():
+    """Start a page rerun; when profiling is switched on, the spans of this rerun are profiled together."""
+    state = _session()
+    if state is not None:
+        state.rerun_profiler = cProfile.Profile() if state.get('profile_reruns') else None
+
+def profile_report(profiler, lines=PROFILE_LINES):
+    """Text of the slowest functions in a profile by cumulative time."""
+    output = io.StringIO()
+    try:
+        pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(lines)
+    except TypeError:
+        # A profiler that never ran has no stats
+        return ''
+    return output.getvalue()
+
+@contextmanager
+def span(name):
+    """Time a block, or a function when used as a decorator.
+
+    The duration goes to the process-wide span stats and, inside a session, to its per-name
+    count, total and maximum in st.session_state.span_totals, which update_log_in_db sends with
+    the session log.
+    The outermost span also drives the rerun profiler when profiling is on.
+    """
+    if not TIMING_ENABLED:
+        yield
+        return
+    state = _session()
+    profiler = state.get('rerun_profiler') if state is not None else None
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    if profiler is not None and depth == 0:
+        profiler.enable()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        if profiler is not None and depth == 0:
+            profiler.disable()
+        _local.depth = depth
+        span_stats.record(name, seconds)
+        if state is not None:
+            totals = state.setdefault('span_totals', {}).setdefault(name, {'count': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            totals['count'] += 1
+            totals['total_ms'] += seconds * 1000
+            totals['max_ms'] = max(totals['max_ms'], seconds * 1000)